@@ -0,0 +1,341 @@
+import argparse
+import ast
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from covid19_derived import add_derived_metrics
+from covid19_downsample import downsample_frame
+from covid19_hierarchy import build_hierarchy, hierarchy_totals
+from covid19_index import build_series_index, build_snapshot, select_rows
+from covid19_pipeline import (
+    create_sample_data,
+    make_ranked_bar_figure,
+    make_bar_grid_figure,
+    make_line_figure,
+    make_line_grid_figure,
+    make_map_figure,
+    warm_aggregates
+)
+from covid19_ranking import rank_page
+from covid19_rollup import build_rollup
+from covid19_shared import open_shared, publish_shared
+from covid19_store import DERIVED_COLUMNS, add_death_rate, build_store, load_store, read_owid_csv
+from covid19_waves import build_waves
+
+# Benchmark harness for the dashboard data path.
+# Generates OWID-shaped data at several scales, times every stage and writes a JSON report:
+#
+#     python covid19_benchmark.py --scales 1 10 --output bench.json
+#     python covid19_benchmark.py --scales 1 --compare bench.json
+#     python covid19_benchmark.py --startup-only --import-budget 1.5
+
+# Number of countries at 1x scale, close to the OWID dataset
+BASE_LOCATIONS = 255
+
+# Filler columns so the CSV is as wide as the OWID one (~67 columns)
+EXTRA_COLUMNS = 52
+
+# Countries compared in the selection stages, like the dashboard defaults
+SELECTED_LOCATIONS = 10
+
+# Metrics selected by default in the dashboard
+DEFAULT_METRICS = ['total_cases', 'total_deaths', 'death_rate', 'people_vaccinated_per_hundred']
+
+# Script the server starts, and the seconds its imports may take in a fresh interpreter
+ENTRY_POINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'covid19_dashboard.py')
+IMPORT_BUDGET_S = 1.5
+
+# Modules that must only be imported when a chart needs them, never at startup
+DEFERRED_MODULES = ['matplotlib', 'seaborn', 'plotly.express', 'plotly.subplots']
+
+
+# OWID-shaped daily rows, one block of BASE_LOCATIONS locations at a time. Block 0 holds the
+# countries; larger scales add (scale - 1) blocks of sub-national regions, one region per country
+# each, the way regional datasets extend OWID. Filler columns are float32, so even at 100x a block
+# stays around 100 MB while the whole dataset never has to fit in memory.
+def synthetic_owid_blocks(scale=1, seed=0, start='2020-01-01', end='2023-12-31', extra_columns=EXTRA_COLUMNS):
+    for block in range(int(scale)):
+        frame = create_sample_data(BASE_LOCATIONS, 'daily', start, end, [seed, block]).drop(columns=DERIVED_COLUMNS)
+        if block:
+            frame['location'] = frame['location'].cat.rename_categories(lambda name: f'{name} Region {block}')
+            frame['iso_code'] = frame['iso_code'].cat.rename_categories(lambda code: f'{code}-{block:02d}')
+        rng = np.random.default_rng([seed, block])
+        extra = (rng.random((len(frame), extra_columns), dtype=np.float32) * 1000).round(1)
+        yield pd.concat([frame, pd.DataFrame(extra, columns=[f'extra_metric_{i}' for i in range(extra_columns)])], axis=1)
+
+
+# Write the synthetic dataset block by block, and the same dataset without its last day
+# (the previous day's file a refresh starts from)
+def write_synthetic_csv(csv_path, previous_path, scale=1, seed=0):
+    for block, frame in enumerate(synthetic_owid_blocks(scale, seed)):
+        mode, header = ('w', True) if block == 0 else ('a', False)
+        frame[frame['date'] < frame['date'].max()].to_csv(previous_path, mode=mode, header=header, index=False)
+        frame.to_csv(csv_path, mode=mode, header=header, index=False)
+
+
+# Wall time of fn() over several repeats; with setup, of fn(setup()) without the setup
+def time_stage(fn, repeats, setup=None):
+    timings = []
+    for _ in range(repeats):
+        args = [] if setup is None else [setup()]
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return {
+        'median_s': statistics.median(timings),
+        'min_s': min(timings),
+        'repeats': repeats
+    }
+
+
+# Time every stage of the data path on one synthetic dataset
+def benchmark_scale(scale, repeats=3, seed=0, workdir=None):
+    stages = {}
+
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        csv_path = os.path.join(tmp, 'owid-covid-data.csv')
+        previous_path = os.path.join(tmp, 'previous.csv')
+        write_synthetic_csv(csv_path, previous_path, scale, seed)
+        csv_bytes = os.path.getsize(csv_path)
+
+        # Parse: the original untyped full-width read, the projected typed read, and the columnar store
+        stages['csv_parse_full'] = time_stage(lambda: pd.read_csv(csv_path), 1)
+        stages['csv_parse_projected'] = time_stage(lambda: read_owid_csv(csv_path), repeats)
+        stages['store_build'] = time_stage(lambda: build_store(csv_path), 1)
+        stages['store_load'] = time_stage(lambda: load_store(csv_path), repeats)
+
+        # A new day of data appended to the store built from the previous day's file; must stay below store_build
+        refresh_path = os.path.join(tmp, 'refresh', 'owid-covid-data.csv')
+        os.makedirs(os.path.dirname(refresh_path))
+        shutil.copyfile(previous_path, refresh_path)
+        previous = load_store(refresh_path)
+        shutil.copyfile(csv_path, refresh_path)
+        stages['store_refresh'] = time_stage(lambda: load_store(refresh_path), 1)
+        refreshed = load_store(refresh_path)
+        df = load_store(csv_path)
+
+        # Hand-off to server processes: publishing the shared copy once, then mapping it per process
+        stages['shared_publish'] = time_stage(lambda: publish_shared(df, csv_path), 1)
+        stages['shared_open'] = time_stage(lambda: open_shared(csv_path), repeats)
+
+    # Aggregates of the refreshed version: warmed from scratch, and updated from the previous version's
+    stages['aggregates_warm'] = time_stage(lambda: warm_aggregates(refreshed, {}), repeats)
+    stages['aggregates_update'] = time_stage(
+        lambda aggregates: warm_aggregates(refreshed, aggregates),
+        repeats,
+        setup=lambda: warm_aggregates(previous, {})
+    )
+    del previous, refreshed
+
+    stages['death_rate'] = time_stage(lambda: add_death_rate(df.copy()), repeats)
+    stages['derived_metrics'] = time_stage(lambda: add_derived_metrics(df.copy()), repeats)
+
+    # Latest per location: the original sort+groupby and the snapshot that replaced it
+    stages['latest_sort_groupby'] = time_stage(lambda: df.sort_values('date').groupby('location', observed=True).tail(1), repeats)
+    stages['latest_snapshot'] = time_stage(lambda: build_snapshot(df), repeats)
+    snapshot = build_snapshot(df)
+
+    # Filtering the default view: the original boolean masks and the per-location index
+    locations = snapshot['latest']['location'].tolist()
+    selected = locations[::max(1, len(locations) // SELECTED_LOCATIONS)][:SELECTED_LOCATIONS]
+    start_date, end_date = df['date'].min(), df['date'].max()
+    stages['filter_mask'] = time_stage(
+        lambda: df[(df['date'] >= start_date) & (df['date'] <= end_date) & df['location'].isin(selected)],
+        repeats
+    )
+    stages['series_index_build'] = time_stage(lambda: build_series_index(df), repeats)
+    series_index = build_series_index(df)
+    stages['filter_index'] = time_stage(lambda: select_rows(series_index, selected, start_date, end_date), repeats)
+    filtered = select_rows(series_index, selected, start_date, end_date)
+
+    # Rollups for wide date ranges, and the rows a full-range chart selection touches at each resolution
+    for resolution in ['weekly', 'monthly']:
+        stages[f'rollup_{resolution}_build'] = time_stage(lambda: build_rollup(df, resolution), repeats)
+        rollup = build_rollup(df, resolution)
+        stages[f'filter_{resolution}'] = time_stage(lambda: select_rows(rollup, selected, start_date, end_date), repeats)
+
+    # Global totals: the hierarchy is built once per data version, then every rerun looks them up
+    stages['hierarchy_build'] = time_stage(lambda: build_hierarchy(df), repeats)
+    hierarchy = build_hierarchy(df)
+    stages['global_totals'] = time_stage(lambda: hierarchy_totals(hierarchy), repeats)
+
+    # Waves of every country, continent and the world, found once per data version
+    stages['wave_detection'] = time_stage(lambda: build_waves(df, hierarchy), repeats)
+
+    # Top countries by vaccination rate: the original full sort and the partial selection
+    latest = snapshot['latest']
+    stages['rank_sort'] = time_stage(
+        lambda: latest.dropna(subset=['people_vaccinated_per_hundred']).sort_values('people_vaccinated_per_hundred', ascending=False),
+        repeats
+    )
+    stages['rank_top'] = time_stage(lambda: rank_page(latest, 'people_vaccinated_per_hundred'), repeats)
+
+    # Figure construction for the map, a comparison bar chart and a time series chart
+    map_data = latest[['iso_code', 'location', 'total_cases', 'total_deaths', 'death_rate']].dropna(subset=['iso_code', 'total_cases'])
+    latest_selected = latest[latest['location'].isin(selected)]
+    time_series = filtered.dropna(subset=['total_cases'])
+    make_ranked_bar_figure(latest_selected, 'total_cases', 'warm-up', {})
+    stages['figure_map'] = time_stage(
+        lambda: make_map_figure(map_data, 'total_cases', ['total_cases', 'total_deaths', 'death_rate'], 'Map'),
+        repeats
+    )
+    stages['figure_bar'] = time_stage(lambda: make_ranked_bar_figure(latest_selected, 'total_cases', 'Bar', {}), repeats)
+    stages['figure_line_full'] = time_stage(lambda: make_line_figure(time_series, 'total_cases', 'Line', {}), repeats)
+    stages['downsample'] = time_stage(lambda: downsample_frame(time_series, 'date', 'total_cases'), repeats)
+    chart_series = downsample_frame(time_series, 'date', 'total_cases')
+    stages['figure_line'] = time_stage(lambda: make_line_figure(chart_series, 'total_cases', 'Line', {}), repeats)
+
+    # The dashboard's default metrics batched into one figure per section
+    metrics = [(col, col) for col in DEFAULT_METRICS]
+    metric_series = downsample_frame(filtered[['location', 'date'] + DEFAULT_METRICS], 'date', DEFAULT_METRICS)
+    stages['figure_bar_grid'] = time_stage(lambda: make_bar_grid_figure(latest_selected, metrics, 'Bars'), repeats)
+    stages['figure_line_grid'] = time_stage(lambda: make_line_grid_figure(metric_series, metrics, 'Lines'), repeats)
+
+    return {
+        'rows': len(df),
+        'locations': len(locations),
+        'csv_bytes': csv_bytes,
+        'stages': stages
+    }
+
+
+# Modules imported at the top level of a script
+def entry_imports(path=ENTRY_POINT):
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return modules
+
+
+# Import the entry point's modules in a fresh interpreter under `python -X importtime`.
+# Returns the total seconds and the cumulative seconds of every module imported.
+def import_profile(modules, cwd):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {', '.join(modules)}"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    cumulative = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        if not cumulative_us.strip().isdigit():
+            continue
+        seconds = int(cumulative_us) / 1e6
+        cumulative[name.strip()] = seconds
+        # Top-level imports are not indented; nested ones are counted in their parent
+        if name.startswith(' ') and not name.startswith('  '):
+            total += seconds
+    return total, cumulative
+
+
+# Cold-start import time of the entry point against its budget, over several fresh interpreters
+def startup_report(budget=IMPORT_BUDGET_S, repeats=3, path=ENTRY_POINT):
+    modules = entry_imports(path)
+    profiles = [import_profile(modules, os.path.dirname(path)) for _ in range(repeats)]
+    total = statistics.median(total for total, _ in profiles)
+    _, cumulative = profiles[-1]
+    return {
+        'modules': modules,
+        'import_s': total,
+        'budget_s': budget,
+        'slowest': sorted(
+            ({'module': name, 'cumulative_s': seconds} for name, seconds in cumulative.items() if name in modules),
+            key=lambda item: -item['cumulative_s']
+        ),
+        'deferred_imported': [name for name in DEFERRED_MODULES if name in cumulative],
+        'over_budget': total > budget
+    }
+
+
+# Stages slower than the baseline report by more than the tolerance
+def find_regressions(report, baseline, tolerance):
+    regressions = []
+    for scale, result in report['scales'].items():
+        base_stages = baseline.get('scales', {}).get(scale, {}).get('stages', {})
+        for stage, timing in result['stages'].items():
+            if stage not in base_stages:
+                continue
+            before, after = base_stages[stage]['median_s'], timing['median_s']
+            if before > 0 and after > before * (1 + tolerance):
+                regressions.append({'scale': scale, 'stage': stage, 'baseline_s': before, 'current_s': after})
+    return regressions
+
+
+def run_benchmarks(scales, repeats=3, seed=0, workdir=None, import_budget=IMPORT_BUDGET_S):
+    return {
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'seed': seed,
+        'startup': startup_report(import_budget, repeats),
+        'scales': {f'{scale}x': benchmark_scale(scale, repeats, seed, workdir) for scale in scales}
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the COVID-19 dashboard data path on synthetic OWID-shaped data.")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1], help="dataset scales to run, e.g. 1 10 100")
+    parser.add_argument('--repeats', type=int, default=3, help="timed repeats per stage")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the synthetic data")
+    parser.add_argument('--output', default='bench_output.json', help="path of the JSON report")
+    parser.add_argument('--workdir', default=None, help="directory for the temporary CSV and store files")
+    parser.add_argument('--compare', default=None, help="baseline JSON report to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown before a stage counts as a regression")
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET_S, help="seconds the dashboard's imports may take on a cold start")
+    parser.add_argument('--startup-only', action='store_true', help="only check the import time of the dashboard")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks([] if args.startup_only else args.scales, args.repeats, args.seed, args.workdir, args.import_budget)
+
+    if args.compare:
+        with open(args.compare) as f:
+            report['regressions'] = find_regressions(report, json.load(f), args.tolerance)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for scale, result in report['scales'].items():
+        print(f"{scale}: {result['rows']:,} rows, {result['locations']} locations")
+        for stage, timing in result['stages'].items():
+            print(f"  {stage:<22} {timing['median_s'] * 1000:10.1f} ms")
+
+    for regression in report.get('regressions', []):
+        print(f"REGRESSION {regression['scale']} {regression['stage']}: "
+              f"{regression['baseline_s'] * 1000:.1f} ms -> {regression['current_s'] * 1000:.1f} ms")
+
+    startup = report['startup']
+    print(f"startup imports: {startup['import_s'] * 1000:.1f} ms (budget {startup['budget_s'] * 1000:.0f} ms)")
+    for item in startup['slowest'][:5]:
+        print(f"  {item['module']:<22} {item['cumulative_s'] * 1000:10.1f} ms")
+    if startup['over_budget']:
+        print("REGRESSION startup imports are over budget")
+    for module in startup['deferred_imported']:
+        print(f"REGRESSION {module} is imported at startup")
+    startup_failed = startup['over_budget'] or startup['deferred_imported']
+    return 1 if report.get('regressions') or startup_failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,116 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# Approximate memory held by a cached value: frames, strings and containers of them
+def approximate_size(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return sum(approximate_size(item) for item in value.ravel())
+        return value.nbytes
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(approximate_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(approximate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+# Least-recently-used cache bounded by entry count and total size, shared safely between sessions.
+# Keep values immutable once cached: every caller gets the same object.
+class LRUCache:
+    def __init__(self, max_entries=128, max_bytes=None, sizeof=approximate_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            if self.max_bytes is not None and size > self.max_bytes:
+                # Larger than the whole cache, serve it without keeping it
+                return value
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+            self.evict()
+        return value
+
+    def evict(self):
+        while self.entries and (
+            len(self.entries) > self.max_entries
+            or (self.max_bytes is not None and self.total_bytes > self.max_bytes)
+        ):
+            _, (_, size) = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+
+    # Return the cached value for key, computing and storing it on a miss
+    def get_or_compute(self, key, compute):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = self.put(key, compute())
+        return value
+
+    # Drop every entry whose key matches, e.g. the entries of data versions no longer served
+    def discard(self, matches):
+        with self.lock:
+            for key in [key for key in self.entries if matches(key)]:
+                self.total_bytes -= self.entries.pop(key)[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.total_bytes
+            }
+
+
+# Normalised cache key for a dashboard selection, so equivalent selections share an entry
+def selection_key(data_version, start_date, end_date, countries=None, metrics=None):
+    return (
+        data_version,
+        pd.Timestamp(start_date),
+        pd.Timestamp(end_date),
+        tuple(sorted(countries or ())),
+        tuple(sorted(metrics or ()))
+    )
+
+
+# Approximate memory held by a figure: its trace arrays and the rest of its properties.
+# Read from the figure's own property dicts, since serialising it just to weigh it costs as much
+# as the st.plotly_chart call that serialises it for the browser anyway.
+def figure_size(fig):
+    return approximate_size(fig._data) + approximate_size(fig._layout)
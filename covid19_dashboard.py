@@ -1,14 +1,23 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 from datetime import datetime
 import os
-import requests
+from covid19_cache import LRUCache, figure_size
+from covid19_hierarchy import WORLD, build_hierarchy, level_members
+from covid19_metrics import StageMetrics, StageRecorder, prometheus_text, write_prometheus
+from covid19_pipeline import (
+    DashboardPipeline,
+    create_sample_data,
+    dataset_summary,
+    discard_other_versions,
+    get_aggregate,
+    warm_aggregates
+)
+from covid19_ranking import RANK_SIZE, rank_positions
+from covid19_refresh import DatasetRefresher
+from covid19_shared import freeze_frame, session_frame, shared_bytes
+from covid19_store import available_metrics, memory_report
+from covid19_waves import RECENT_WAVE_DAYS, level_waves, recent_waves
 
 # Set page configuration
 st.set_page_config(
@@ -195,738 +204,801 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# Our World in Data COVID-19 dataset and its local copy
+DATA_URL = 'https://covid.ourworldindata.org/data/owid-covid-data.csv'
+DATA_FILE = 'data/owid-covid-data.csv'
+
+# Data version of the sample data shown while the dataset is unavailable
+SAMPLE_VERSION = 'sample-0'
+
 # Function to load data
-@st.cache_data(ttl=3600)  # Cache data for 1 hour
+# Serves the dataset held by the background refresher; requests never wait for a download or parse.
+# Every rerun of every session gets a shallow copy over the same read-only buffers, never a copy
+# of the data, and everything derived from it is cached under its data version rather than a
+# hash of its contents.
 def load_data():
+    refresher = dataset_refresher()
+    df = refresher.current()
+    if df is not None:
+        return session_frame(df)
+
+    status = refresher.status()
+    if status['error']:
+        st.error(f"Error loading the dataset: {status['error']}")
+    elif status['checked_at'] is None:
+        st.info("The COVID-19 dataset is being downloaded in the background. Reload the page in a minute to see it.")
+    return load_sample_data()
+
+# Function to create sample data if loading fails
+def load_sample_data():
+    st.warning("Using sample data for demonstration. The actual COVID-19 dataset could not be loaded.")
+    return session_frame(sample_dataset())
+
+# Sample data, generated once per process and versioned like the real dataset so its views are cached too
+@st.cache_resource
+def sample_dataset():
+    df = create_sample_data(seed=0)
+    df.attrs['data_version'] = SAMPLE_VERSION
+    return freeze_frame(df)
+
+# Aggregates derived from the dataset, shared across reruns and tagged with their data version
+@st.cache_resource
+def derived_aggregates():
+    return {}
+
+# Background worker keeping the dataset current: checks for a new version every hour,
+# parses it and builds its aggregates off the request path, then swaps it in
+@st.cache_resource
+def dataset_refresher():
+    return DatasetRefresher(
+        DATA_URL,
+        DATA_FILE,
+        on_refresh=lambda df: warm_aggregates(df, derived_aggregates())
+    ).start()
+
+# Filtered frames and aggregates for recent selections, shared by every session
+@st.cache_resource
+def view_cache():
+    return LRUCache(max_entries=256, max_bytes=256 * 1024 * 1024)
+
+# Built figures for recent charts, shared by every session and bounded by the size of their JSON spec
+@st.cache_resource
+def figure_cache():
+    return LRUCache(max_entries=256, max_bytes=128 * 1024 * 1024, sizeof=figure_size)
+
+# Runs once when a rerun first serves a new data version: drops the views and figures of the old one
+@st.cache_resource(max_entries=1)
+def serve_version(version):
+    discard_other_versions([view_cache(), figure_cache()], version)
+    return version
+
+# Stage timings of every instrumented rerun, shared by all sessions
+@st.cache_resource
+def stage_metrics():
+    return StageMetrics()
+
+# Section: stage timings, cache counters and the Prometheus export, for debugging slow reruns
+def render_debug_panel(recorder):
+    with st.sidebar.expander("Performance metrics"):
+        st.checkbox("Record stage timings", key='debug_metrics')
+        st.checkbox("Trace memory (slower)", key='debug_trace_memory')
+
+        if recorder.records:
+            timings = pd.DataFrame(recorder.records)
+            timings['ms'] = (timings.pop('seconds') * 1000).round(1)
+            st.caption("Stages of this rerun")
+            st.dataframe(timings, hide_index=True, use_container_width=True)
+
+        caches = {'views': view_cache().stats(), 'figures': figure_cache().stats()}
+        st.caption("Cache statistics")
+        st.json(caches)
+
+        metrics_text = prometheus_text(stage_metrics().snapshot(), caches)
+        st.download_button("Download Prometheus metrics", metrics_text, file_name='covid19_metrics.prom', mime='text/plain')
+
+        # Keep a file up to date for a Prometheus textfile collector when one is configured
+        metrics_file = os.environ.get('COVID19_METRICS_FILE')
+        if metrics_file and recorder.enabled:
+            try:
+                write_prometheus(metrics_file, metrics_text)
+            except OSError as e:
+                st.warning(f"Could not write metrics file: {str(e)}")
+
+# Run a section as a fragment: a widget inside it reruns that section alone, against the
+# pipeline and selections of the last full run, which are its only inputs
+@st.fragment
+def section_fragment(name, render, pipeline, *args):
+    recorder = pipeline.recorder
+    # A fragment rerun comes after the full run reported its stages, so it reports its own
+    rerun = recorder.finished
+    first = len(recorder.records)
     try:
-        # Create data directory if it doesn't exist
-        if not os.path.exists('data'):
-            os.makedirs('data')
-
-        # URL for the Our World in Data COVID-19 dataset
-        url = 'https://covid.ourworldindata.org/data/owid-covid-data.csv'
-        file_path = 'data/owid-covid-data.csv'
-
-        # Download the dataset if it doesn't exist
-        if not os.path.exists(file_path):
-            with st.spinner("Downloading COVID-19 dataset..."):
-                try:
-                    response = requests.get(url, timeout=30)
-                    response.raise_for_status()  # Raise an exception for HTTP errors
-                    with open(file_path, 'wb') as f:
-                        f.write(response.content)
-                    st.success("Download complete!")
-                except requests.exceptions.RequestException as e:
-                    st.error(f"Error downloading the dataset: {str(e)}")
-                    # If download fails and file doesn't exist, create a sample dataframe
-                    if not os.path.exists(file_path):
-                        st.warning("Using sample data instead.")
-                        return create_sample_data()
-
-        # Load the dataset
-        try:
-            df = pd.read_csv(file_path)
+        with recorder.stage(f'section:{name}'):
+            render(pipeline, *args)
+    finally:
+        if rerun:
+            stage_metrics().record(recorder.finish()[first:])
+            del recorder.records[first:]
+
+# Section: dataset cards and global overview
+def render_overview(pipeline):
+    summary = pipeline.summary
+
+    # Create three columns for the metrics
+    col1, col2, col3 = st.columns(3)
+
+    # Add some additional CSS for the cards
+    st.markdown("""
+    <style>
+        .data-card {
+            height: 100%;
+            padding: 20px;
+            background: white;
+            border-radius: 10px;
+            box-shadow: 0 4px 15px rgba(0,0,0,0.1);
+            text-align: center;
+            transition: all 0.3s ease;
+            position: relative;
+            overflow: hidden;
+        }
 
-            # Check if the dataset has the expected columns
-            required_columns = ['date', 'location', 'total_cases', 'total_deaths']
-            missing_columns = [col for col in required_columns if col not in df.columns]
+        .data-card:hover {
+            transform: translateY(-5px);
+            box-shadow: 0 8px 25px rgba(0,0,0,0.15);
+        }
 
-            if missing_columns:
-                st.warning(f"Dataset is missing required columns: {', '.join(missing_columns)}. Using sample data instead.")
-                return create_sample_data()
+        .data-card::before {
+            content: '';
+            position: absolute;
+            top: 0;
+            left: 0;
+            width: 5px;
+            height: 100%;
+            transition: all 0.3s ease;
+        }
 
-            # Convert date column to datetime
-            df['date'] = pd.to_datetime(df['date'])
+        .data-card:hover::before {
+            width: 10px;
+        }
 
-            # Calculate death rate
-            if 'total_cases' in df.columns and 'total_deaths' in df.columns:
-                df['death_rate'] = (df['total_deaths'] / df['total_cases'] * 100).round(2)
-                df['death_rate'] = df['death_rate'].replace([np.inf, -np.inf], np.nan).fillna(0)
-            else:
-                df['death_rate'] = 0
+        .countries-card::before { background-color: #4285F4; }
+        .date-card::before { background-color: #EA4335; }
+        .records-card::before { background-color: #34A853; }
 
-            return df
+        .card-icon {
+            font-size: 32px;
+            margin-bottom: 10px;
+            display: inline-block;
+            animation: pulse 2s infinite;
+        }
 
-        except Exception as e:
-            st.error(f"Error loading the dataset: {str(e)}")
-            return create_sample_data()
+        .countries-card .card-icon { color: #4285F4; }
+        .date-card .card-icon { color: #EA4335; }
+        .records-card .card-icon { color: #34A853; }
 
-    except Exception as e:
-        st.error(f"Unexpected error: {str(e)}")
-        return create_sample_data()
+        .card-label {
+            font-size: 16px;
+            color: #555;
+            font-weight: 500;
+            margin-bottom: 10px;
+        }
 
-# Function to create sample data if loading fails
-def create_sample_data():
-    # Create a sample dataframe with minimal data for demonstration
-    # Use real country codes for the map to work properly
-    country_data = [
-        {'name': 'United States', 'iso_code': 'USA'},
-        {'name': 'India', 'iso_code': 'IND'},
-        {'name': 'Brazil', 'iso_code': 'BRA'},
-        {'name': 'United Kingdom', 'iso_code': 'GBR'},
-        {'name': 'Russia', 'iso_code': 'RUS'},
-        {'name': 'Germany', 'iso_code': 'DEU'},
-        {'name': 'France', 'iso_code': 'FRA'},
-        {'name': 'Italy', 'iso_code': 'ITA'},
-        {'name': 'Spain', 'iso_code': 'ESP'},
-        {'name': 'China', 'iso_code': 'CHN'}
-    ]
-
-    countries = [c['name'] for c in country_data]
-    iso_codes = {c['name']: c['iso_code'] for c in country_data}
-
-    dates = pd.date_range(start='2020-01-01', end='2023-01-01', freq='M')
-
-    # Create empty dataframe
-    sample_data = []
-
-    # Generate sample data for each country and date
-    for country in countries:
-        for i, date in enumerate(dates):
-            # Generate increasing values over time with some randomness
-            country_index = countries.index(country) + 1
-            base_cases = i * 10000 * country_index
-            base_deaths = i * 500 * country_index
-
-            # Add some randomness (±10%)
-            import random
-            random_factor = 0.9 + random.random() * 0.2  # Between 0.9 and 1.1
-
-            total_cases = int(base_cases * random_factor)
-            total_deaths = int(base_deaths * random_factor)
-            new_cases = int(5000 * country_index * random_factor) if i > 0 else 0
-            new_deaths = int(250 * country_index * random_factor) if i > 0 else 0
-
-            # Calculate vaccination data (starting from month 12)
-            vax_start_month = 12
-            people_vaccinated = int(i * 5000 * country_index * random_factor) if i > vax_start_month else 0
-            vax_percent = min(((i - vax_start_month) * 5 * country_index * random_factor / 5), 100) if i > vax_start_month else 0
-
-            # Calculate death rate
-            death_rate = (total_deaths / total_cases * 100) if total_cases > 0 else 0
-
-            sample_data.append({
-                'date': date,
-                'location': country,
-                'iso_code': iso_codes[country],
-                'total_cases': total_cases,
-                'new_cases': new_cases,
-                'total_deaths': total_deaths,
-                'new_deaths': new_deaths,
-                'people_vaccinated': people_vaccinated,
-                'people_vaccinated_per_hundred': vax_percent,
-                'people_fully_vaccinated': int(people_vaccinated * 0.8),  # 80% of vaccinated are fully vaccinated
-                'people_fully_vaccinated_per_hundred': vax_percent * 0.8 if vax_percent > 0 else 0,
-                'death_rate': death_rate
-            })
-
-    df = pd.DataFrame(sample_data)
-    st.warning("Using sample data for demonstration. The actual COVID-19 dataset could not be loaded.")
-    return df
+        .card-value {
+            font-size: 28px;
+            font-weight: 700;
+            margin: 10px 0;
+            animation: countUp 1s ease-out forwards;
+        }
 
-# Load the data
-try:
-    df = load_data()
-except Exception as e:
-    st.error(f"Failed to load data: {str(e)}")
-    st.stop()
+        .countries-card .card-value { color: #4285F4; }
+        .date-card .card-value { color: #EA4335; }
+        .records-card .card-value { color: #34A853; }
 
-# Sidebar filters
-st.sidebar.header("Filters")
+        .card-desc {
+            font-size: 14px;
+            color: #666;
+            margin-top: 10px;
+        }
 
-# Date range filter
-min_date = df['date'].min().date()
-max_date = df['date'].max().date()
-start_date, end_date = st.sidebar.date_input(
-    "Select Date Range",
-    [min_date, max_date],
-    min_value=min_date,
-    max_value=max_date
-)
+        @keyframes countUp {
+            from { opacity: 0; transform: translateY(20px); }
+            to { opacity: 1; transform: translateY(0); }
+        }
+    </style>
+    """, unsafe_allow_html=True)
 
-# Convert back to datetime for filtering
-start_date = pd.to_datetime(start_date)
-end_date = pd.to_datetime(end_date)
+    with col1:
+        st.markdown(f"""
+        <div class="data-card countries-card">
+            <div class="card-icon">🌎</div>
+            <div class="card-label">TOTAL COUNTRIES</div>
+            <div class="card-value">{len(summary['locations'])}</div>
+            <div class="card-desc">Nations tracked in dataset</div>
+        </div>
+        """, unsafe_allow_html=True)
 
-# Country selection
-all_countries = sorted(df['location'].unique())
-default_countries = ['United States', 'India', 'Brazil', 'United Kingdom', 'Russia', 'France', 'Germany', 'South Africa', 'Kenya', 'China']
-default_countries = [c for c in default_countries if c in all_countries]  # Ensure defaults exist in the data
+    with col2:
+        st.markdown(f"""
+        <div class="data-card date-card">
+            <div class="card-icon">📅</div>
+            <div class="card-label">DATE RANGE</div>
+            <div class="card-value" style="font-size: 22px;">{summary['min_date']} to {summary['max_date']}</div>
+            <div class="card-desc">Time period covered</div>
+        </div>
+        """, unsafe_allow_html=True)
 
-selected_countries = st.sidebar.multiselect(
-    "Select Countries",
-    all_countries,
-    default=default_countries
-)
+    with col3:
+        st.markdown(f"""
+        <div class="data-card records-card">
+            <div class="card-icon">📈</div>
+            <div class="card-label">TOTAL RECORDS</div>
+            <div class="card-value">{summary['rows']:,}</div>
+            <div class="card-desc">Data points analyzed</div>
+        </div>
+        """, unsafe_allow_html=True)
 
-# Metric selection
-available_metrics = {
-    'Total Cases': 'total_cases',
-    'New Cases': 'new_cases',
-    'Total Deaths': 'total_deaths',
-    'New Deaths': 'new_deaths',
-    'Death Rate (%)': 'death_rate',
-    'Total Vaccinations': 'total_vaccinations',
-    'People Vaccinated': 'people_vaccinated',
-    'People Fully Vaccinated': 'people_fully_vaccinated',
-    'People Vaccinated (%)': 'people_vaccinated_per_hundred',
-    'People Fully Vaccinated (%)': 'people_fully_vaccinated_per_hundred'
-}
+    # Latest totals of the world or the selected continent, summed over countries only
+    global_totals = pipeline.global_totals
 
-selected_metrics = st.sidebar.multiselect(
-    "Select Metrics to Display",
-    list(available_metrics.keys()),
-    default=['Total Cases', 'Total Deaths', 'Death Rate (%)', 'People Vaccinated (%)']
-)
+    # Global overview with enhanced styling and animations
+    st.markdown("""
 
-# Filter data based on selections
-filtered_df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
-if selected_countries:
-    filtered_df = filtered_df[filtered_df['location'].isin(selected_countries)]
+    <style>
+        @keyframes pulse {
+            0% { transform: scale(1); }
+            50% { transform: scale(1.1); }
+            100% { transform: scale(1); }
+        }
 
-# Create three columns for the metrics
-col1, col2, col3 = st.columns(3)
+        @keyframes fadeIn {
+            0% { opacity: 0; transform: translateY(20px); }
+            100% { opacity: 1; transform: translateY(0); }
+        }
 
-# Add some additional CSS for the cards
-st.markdown("""
-<style>
-    .data-card {
-        height: 100%;
-        padding: 20px;
-        background: white;
-        border-radius: 10px;
-        box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-        text-align: center;
-        transition: all 0.3s ease;
-        position: relative;
-        overflow: hidden;
-    }
+        @keyframes countUp {
+            from { opacity: 0; transform: translateY(20px); }
+            to { opacity: 1; transform: translateY(0); }
+        }
 
-    .data-card:hover {
-        transform: translateY(-5px);
-        box-shadow: 0 8px 25px rgba(0,0,0,0.15);
-    }
+        .metric-card {
+            background: white;
+            border-radius: 10px;
+            padding: 15px 10px;
+            box-shadow: 0 4px 15px rgba(0,0,0,0.1);
+            text-align: center;
+            margin: 10px;
+            transition: all 0.3s ease;
+            animation: fadeIn 0.8s ease-out forwards;
+            border-left: 5px solid;
+            height: 100%;
+            display: flex;
+            flex-direction: column;
+            justify-content: center;
+            align-items: center;
+            width: 100%;
+        }
 
-    .data-card::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: 0;
-        width: 5px;
-        height: 100%;
-        transition: all 0.3s ease;
-    }
+        .metric-card:hover {
+            transform: translateY(-5px);
+            box-shadow: 0 8px 25px rgba(0,0,0,0.15);
+        }
 
-    .data-card:hover::before {
-        width: 10px;
-    }
+        .metric-icon {
+            font-size: 28px;
+            margin-bottom: 8px;
+            display: inline-block;
+        }
 
-    .countries-card::before { background-color: #4285F4; }
-    .date-card::before { background-color: #EA4335; }
-    .records-card::before { background-color: #34A853; }
+        .metric-value {
+            font-size: calc(18px + 1.5vw);
+            font-weight: 700;
+            margin: 8px 0;
+            animation: countUp 1s ease-out forwards;
+            word-break: break-word;
+            line-height: 1.2;
+        }
 
-    .card-icon {
-        font-size: 32px;
-        margin-bottom: 10px;
-        display: inline-block;
-        animation: pulse 2s infinite;
-    }
+        .metric-label {
+            font-size: calc(12px + 0.3vw);
+            color: #555;
+            font-weight: 500;
+            margin-bottom: 5px;
+        }
 
-    .countries-card .card-icon { color: #4285F4; }
-    .date-card .card-icon { color: #EA4335; }
-    .records-card .card-icon { color: #34A853; }
+        .metric-desc {
+            font-size: calc(10px + 0.2vw);
+            color: #666;
+            line-height: 1.3;
+            margin-top: 5px;
+        }
 
-    .card-label {
-        font-size: 16px;
-        color: #555;
-        font-weight: 500;
-        margin-bottom: 10px;
-    }
+        .cases-card { border-color: #FF9800; animation-delay: 0.1s; }
+        .cases-card .metric-icon { color: #FF9800; }
+        .cases-card .metric-value { color: #FF9800; }
 
-    .card-value {
-        font-size: 28px;
-        font-weight: 700;
-        margin: 10px 0;
-        animation: countUp 1s ease-out forwards;
-    }
+        .deaths-card { border-color: #F44336; animation-delay: 0.3s; }
+        .deaths-card .metric-icon { color: #F44336; }
+        .deaths-card .metric-value { color: #F44336; }
 
-    .countries-card .card-value { color: #4285F4; }
-    .date-card .card-value { color: #EA4335; }
-    .records-card .card-value { color: #34A853; }
+        .rate-card { border-color: #673AB7; animation-delay: 0.5s; }
+        .rate-card .metric-icon { color: #673AB7; }
+        .rate-card .metric-value { color: #673AB7; }
 
-    .card-desc {
-        font-size: 14px;
-        color: #666;
-        margin-top: 10px;
-    }
+        .vax-card { border-color: #4CAF50; animation-delay: 0.7s; }
+        .vax-card .metric-icon { color: #4CAF50; }
+        .vax-card .metric-value { color: #4CAF50; }
 
-    @keyframes countUp {
-        from { opacity: 0; transform: translateY(20px); }
-        to { opacity: 1; transform: translateY(0); }
-    }
-</style>
-""", unsafe_allow_html=True)
+        /* Media queries for better responsiveness */
+        @media (max-width: 768px) {
+            .metric-value {
+                font-size: calc(16px + 1vw);
+            }
 
-with col1:
-    st.markdown(f"""
-    <div class="data-card countries-card">
-        <div class="card-icon">🌎</div>
-        <div class="card-label">TOTAL COUNTRIES</div>
-        <div class="card-value">{df['location'].nunique()}</div>
-        <div class="card-desc">Nations tracked in dataset</div>
-    </div>
-    """, unsafe_allow_html=True)
+            .metric-icon {
+                font-size: 24px;
+            }
 
-with col2:
-    st.markdown(f"""
-    <div class="data-card date-card">
-        <div class="card-icon">📅</div>
-        <div class="card-label">DATE RANGE</div>
-        <div class="card-value" style="font-size: 22px;">{min_date} to {max_date}</div>
-        <div class="card-desc">Time period covered</div>
-    </div>
+            .metric-label {
+                font-size: 14px;
+            }
+
+            .metric-desc {
+                font-size: 12px;
+            }
+
+            .metric-card {
+                padding: 10px 5px;
+            }
+        }
+    </style>
     """, unsafe_allow_html=True)
 
-with col3:
-    st.markdown(f"""
-    <div class="data-card records-card">
-        <div class="card-icon">📈</div>
-        <div class="card-label">TOTAL RECORDS</div>
-        <div class="card-value">{len(df):,}</div>
-        <div class="card-desc">Data points analyzed</div>
+    if pipeline.continent != WORLD:
+        st.caption(f"Totals for {pipeline.continent}")
+
+    # Create custom metric cards with animations - use responsive layout
+    col1, col2 = st.columns(2)
+    col3, col4 = st.columns(2)
+
+    with col1:
+        if global_totals['total_cases'] is not None:
+            st.markdown(f"""
+            <div class="metric-card cases-card">
+                <div class="metric-icon">🦠</div>
+                <div class="metric-label">TOTAL CASES</div>
+                <div class="metric-value">{global_totals['total_cases']:,.0f}</div>
+                <div class="metric-desc">Confirmed infections worldwide</div>
+            </div>
+            """, unsafe_allow_html=True)
+        else:
+            st.markdown("""
+            <div class="metric-card cases-card">
+                <div class="metric-icon">🦠</div>
+                <div class="metric-label">TOTAL CASES</div>
+                <div class="metric-value">Data not available</div>
+            </div>
+            """, unsafe_allow_html=True)
+
+    with col2:
+        if global_totals['total_deaths'] is not None:
+            st.markdown(f"""
+            <div class="metric-card deaths-card">
+                <div class="metric-icon">💔</div>
+                <div class="metric-label">TOTAL DEATHS</div>
+                <div class="metric-value">{global_totals['total_deaths']:,.0f}</div>
+                <div class="metric-desc">Lives lost to COVID-19</div>
+            </div>
+            """, unsafe_allow_html=True)
+        else:
+            st.markdown("""
+            <div class="metric-card deaths-card">
+                <div class="metric-icon">💔</div>
+                <div class="metric-label">TOTAL DEATHS</div>
+                <div class="metric-value">Data not available</div>
+            </div>
+            """, unsafe_allow_html=True)
+
+    with col3:
+        if global_totals['total_cases'] is not None and global_totals['total_deaths'] is not None and global_totals['total_cases'] > 0:
+            death_rate = (global_totals['total_deaths'] / global_totals['total_cases'] * 100).round(2)
+            st.markdown(f"""
+            <div class="metric-card rate-card">
+                <div class="metric-icon">📊</div>
+                <div class="metric-label">DEATH RATE</div>
+                <div class="metric-value">{death_rate}%</div>
+                <div class="metric-desc">Case fatality ratio</div>
+            </div>
+            """, unsafe_allow_html=True)
+        else:
+            st.markdown("""
+            <div class="metric-card rate-card">
+                <div class="metric-icon">📊</div>
+                <div class="metric-label">DEATH RATE</div>
+                <div class="metric-value">Data not available</div>
+            </div>
+            """, unsafe_allow_html=True)
+
+    with col4:
+        if global_totals['people_vaccinated'] is not None:
+            st.markdown(f"""
+            <div class="metric-card vax-card">
+                <div class="metric-icon">💉</div>
+                <div class="metric-label">VACCINATED</div>
+                <div class="metric-value">{global_totals['people_vaccinated']:,.0f}</div>
+                <div class="metric-desc">People with at least one dose</div>
+            </div>
+            """, unsafe_allow_html=True)
+        else:
+            st.markdown("""
+            <div class="metric-card vax-card">
+                <div class="metric-icon">💉</div>
+                <div class="metric-label">VACCINATED</div>
+                <div class="metric-value">Data not available</div>
+            </div>
+            """, unsafe_allow_html=True)
+
+    # Add a separator with animation
+    st.markdown("""
+    <div style="margin: 30px 0; text-align: center; overflow: hidden;">
+        <div style="display: inline-block; position: relative; animation: fadeIn 1s ease-out forwards; animation-delay: 0.9s; opacity: 0;">
+            <hr style="width: 100px; display: inline-block; border: none; height: 2px; background: linear-gradient(90deg, transparent, rgba(30, 60, 114, 0.5), transparent);">
+            <span style="margin: 0 15px; color: #555; position: relative; top: -3px;">UPDATED DATA</span>
+            <hr style="width: 100px; display: inline-block; border: none; height: 2px; background: linear-gradient(90deg, transparent, rgba(30, 60, 114, 0.5), transparent);">
+        </div>
     </div>
     """, unsafe_allow_html=True)
 
-# Get the latest global data (needed for both map and overview)
-latest_global = df.sort_values('date').groupby('location').tail(1)
-
-# Filter out 'World' and 'International' entries and select only numeric columns for summing
-numeric_cols = ['total_cases', 'total_deaths', 'new_cases', 'new_deaths', 'total_vaccinations', 'people_vaccinated']
-filtered_global = latest_global[~latest_global['location'].isin(['World', 'International'])]
+# Section: world map
+def render_world_map(pipeline):
+    st.header("Global COVID-19 Map")
+    st.markdown("""
+    This interactive map shows the global distribution of COVID-19 metrics.
+    Select a metric from the dropdown below to visualize its distribution across countries.
+    Hover over countries to see detailed information.
+    """)
+
+    # Select metric for the map
+    map_metric = st.selectbox(
+        "Select Metric for World Map",
+        list(available_metrics.keys()),
+        index=0
+    )
+
+    map_metric_col = available_metrics[map_metric]
+    latest_global = pipeline.latest_global
+
+    # Create a choropleth map
+    if map_metric_col in latest_global.columns:
+        try:
+            # Make sure iso_code column exists
+            if 'iso_code' not in latest_global.columns:
+                st.warning("ISO country codes are missing in the dataset, which are required for the world map visualization.")
+            elif not latest_global['iso_code'].notna().any():
+                st.warning("No valid ISO country codes found in the dataset.")
+            else:
+                # Latest data with the map columns, without rows missing iso_code or the selected metric
+                map_data, _ = pipeline.map_data(map_metric_col)
 
-# Calculate global totals for numeric columns
-global_totals = {}
-for col in numeric_cols:
-    if col in filtered_global.columns:
-        global_totals[col] = filtered_global[col].sum(skipna=True)
+                if map_data.empty:
+                    st.warning(f"No data available for {map_metric} with valid ISO codes.")
+                else:
+                    # Create the choropleth map (it only depends on the metric and the data version)
+                    st.plotly_chart(pipeline.map_figure(map_metric_col, map_metric), use_container_width=True)
+        except Exception as e:
+            st.error(f"Error creating the map visualization: {str(e)}")
+            # Print more detailed error information for debugging
+            import traceback
+            st.error(f"Detailed error: {traceback.format_exc()}")
     else:
-        global_totals[col] = None
+        st.warning(f"Data for {map_metric} is not available for the world map visualization.")
 
-# Global overview with enhanced styling and animations
-st.markdown("""
+# Section: latest values of the selected countries
+def render_country_comparison(pipeline, selected_metrics):
+    st.header("Country Comparison")
 
-<style>
-    @keyframes pulse {
-        0% { transform: scale(1); }
-        50% { transform: scale(1.1); }
-        100% { transform: scale(1); }
-    }
+    try:
+        # Get the latest data for selected countries, ranked by total cases
+        latest_selected = pipeline.latest_selected
 
-    @keyframes fadeIn {
-        0% { opacity: 0; transform: translateY(20px); }
-        100% { opacity: 1; transform: translateY(0); }
-    }
+        if latest_selected.empty:
+            st.warning("No data available for the selected countries.")
+            return
+
+        # Metrics with data for the selected countries, charted together in one figure
+        metrics = []
+        for metric_name in selected_metrics:
+            metric_col = available_metrics[metric_name]
+            if metric_col in latest_selected.columns and latest_selected[metric_col].notna().any():
+                metrics.append((metric_col, metric_name))
+            else:
+                st.warning(f"Data for {metric_name} is not available for some or all selected countries.")
+
+        # Many selected countries are compared a page at a time
+        page = 1
+        if pipeline.comparison_pages > 1:
+            page = st.number_input(
+                f"Countries {RANK_SIZE} at a time, by total cases: page",
+                min_value=1,
+                max_value=pipeline.comparison_pages,
+                value=1,
+                key='comparison_page'
+            )
+
+        if metrics:
+            try:
+                st.plotly_chart(pipeline.comparison_figure(metrics, page - 1), use_container_width=True)
+            except Exception as e:
+                st.error(f"Error creating comparison charts: {str(e)}")
+    except Exception as e:
+        st.error(f"Error in country comparison: {str(e)}")
 
-    @keyframes countUp {
-        from { opacity: 0; transform: translateY(20px); }
-        to { opacity: 1; transform: translateY(0); }
-    }
+# Section: selected metrics over time for the selected countries
+def render_time_series(pipeline, selected_metrics):
+    st.header("Time Series Analysis")
 
-    .metric-card {
-        background: white;
-        border-radius: 10px;
-        padding: 15px 10px;
-        box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-        text-align: center;
-        margin: 10px;
-        transition: all 0.3s ease;
-        animation: fadeIn 0.8s ease-out forwards;
-        border-left: 5px solid;
-        height: 100%;
-        display: flex;
-        flex-direction: column;
-        justify-content: center;
-        align-items: center;
-        width: 100%;
-    }
+    try:
+        # Rows of the selected countries with a value for any selected metric, taken once for all of them
+        metric_series = pipeline.metric_series([available_metrics[name] for name in selected_metrics])
+
+        metrics = []
+        for metric_name in selected_metrics:
+            metric_col = available_metrics[metric_name]
+            if metric_col in metric_series.columns and metric_series[metric_col].notna().any():
+                metrics.append((metric_col, metric_name))
+            else:
+                st.warning(f"Time series data for {metric_name} is not available for some or all selected countries.")
 
-    .metric-card:hover {
-        transform: translateY(-5px);
-        box-shadow: 0 8px 25px rgba(0,0,0,0.15);
-    }
+        if metrics:
+            if pipeline.resolution != 'daily':
+                st.caption(
+                    f"Showing {pipeline.resolution} data for the selected range: new cases and deaths are "
+                    f"{pipeline.resolution} totals, other metrics the last value reported in each period."
+                )
+            try:
+                st.plotly_chart(pipeline.time_series_figure(metrics), use_container_width=True)
+            except Exception as e:
+                st.error(f"Error creating time series charts: {str(e)}")
+    except Exception as e:
+        st.error(f"Error in time series analysis: {str(e)}")
 
-    .metric-icon {
-        font-size: 28px;
-        margin-bottom: 8px;
-        display: inline-block;
-    }
+# Section: vaccination rates and progress
+def render_vaccination(pipeline):
+    st.header("Vaccination Progress")
 
-    .metric-value {
-        font-size: calc(18px + 1.5vw);
-        font-weight: 700;
-        margin: 8px 0;
-        animation: countUp 1s ease-out forwards;
-        word-break: break-word;
-        line-height: 1.2;
-    }
+    try:
+        # Check if vaccination data column exists
+        if 'people_vaccinated_per_hundred' not in pipeline.filtered.columns:
+            st.warning("Vaccination data (people_vaccinated_per_hundred) is not available in the dataset.")
+            return
 
-    .metric-label {
-        font-size: calc(12px + 0.3vw);
-        color: #555;
-        font-weight: 500;
-        margin-bottom: 5px;
-    }
+        if pipeline.vaccination.empty:
+            st.warning("Vaccination data is not available for the selected countries or time period.")
+            return
+
+        # Ranked bar chart of vaccination rates, a page of countries at a time
+        order = st.radio("Countries with the", ["Highest rates", "Lowest rates"], horizontal=True, key='vaccination_order')
+        ascending = order == "Lowest rates"
+        pages = pipeline.vaccination_ranking(0, ascending)['pages']
+        page = 1
+        if pages > 1:
+            page = st.number_input("Page", min_value=1, max_value=pages, value=1, key='vaccination_page')
+        try:
+            st.plotly_chart(pipeline.vaccination_bar_figure(page - 1, ascending), use_container_width=True)
+        except Exception as e:
+            st.error(f"Error creating vaccination rate chart: {str(e)}")
 
-    .metric-desc {
-        font-size: calc(10px + 0.2vw);
-        color: #666;
-        line-height: 1.3;
-        margin-top: 5px;
-    }
+        # Create a time series plot for vaccination progress
+        if pipeline.countries:
+            try:
+                st.plotly_chart(pipeline.vaccination_line_figure(), use_container_width=True)
+            except Exception as e:
+                st.error(f"Error creating vaccination progress chart: {str(e)}")
+    except Exception as e:
+        st.error(f"Error processing vaccination data: {str(e)}")
 
-    .cases-card { border-color: #FF9800; animation-delay: 0.1s; }
-    .cases-card .metric-icon { color: #FF9800; }
-    .cases-card .metric-value { color: #FF9800; }
+# Countries with the highest latest values of a metric, as "Name (value)" labels
+def leading_countries(latest, metric_col, count=3, suffix=''):
+    if metric_col not in latest.columns:
+        return []
+    top = latest.take(rank_positions(latest[metric_col], count))
+    return [f"{row['location']} ({row[metric_col]:,.0f}{suffix})" for _, row in top.iterrows()]
 
-    .deaths-card { border-color: #F44336; animation-delay: 0.3s; }
-    .deaths-card .metric-icon { color: #F44336; }
-    .deaths-card .metric-value { color: #F44336; }
+def join_names(names):
+    return names[0] if len(names) == 1 else f"{', '.join(names[:-1])} and {names[-1]}"
 
-    .rate-card { border-color: #673AB7; animation-delay: 0.5s; }
-    .rate-card .metric-icon { color: #673AB7; }
-    .rate-card .metric-value { color: #673AB7; }
+# Section: insights computed from the whole dataset for the selected continent or the world:
+# where cases and vaccination are highest, and the waves of infection found in every country
+def render_insights(pipeline):
+    st.header("Key Insights")
 
-    .vax-card { border-color: #4CAF50; animation-delay: 0.7s; }
-    .vax-card .metric-icon { color: #4CAF50; }
-    .vax-card .metric-value { color: #4CAF50; }
+    try:
+        scope = pipeline.continent
+        region = "worldwide" if scope == WORLD else f"in {scope}"
+        countries = level_members(pipeline.hierarchy, [scope])
+        latest = pipeline.latest_global[pipeline.latest_global['location'].isin(countries)]
+        waves = pipeline.waves
+        country_waves = waves['countries'].reindex(countries).dropna(subset=['waves'])
+        insights = []
+
+        most_cases = leading_countries(latest, 'total_cases')
+        if most_cases:
+            insights.append(f"**Global Case Distribution**: {join_names(most_cases)} have reported the most cases {region}.")
+
+        most_vaccinated = leading_countries(latest, 'people_vaccinated_per_hundred', suffix='%')
+        if most_vaccinated:
+            insights.append(f"**Vaccination Progress**: {join_names(most_vaccinated)} have vaccinated the largest share of their population {region}.")
+
+        scope_waves = level_waves(waves, scope)
+        if not scope_waves.empty:
+            largest = scope_waves.loc[scope_waves['peak_new_cases'].idxmax()]
+            peaks = join_names([f"{date:%b %Y}" for date in scope_waves['peak_date']])
+            insights.append(
+                f"**Waves of Infection**: Cases {region} rose and fell in {len(scope_waves)} "
+                f"wave{'s' if len(scope_waves) != 1 else ''}, peaking in {peaks}. The largest peaked in "
+                f"{largest['peak_date']:%B %Y} at {largest['peak_new_cases']:,.0f} new cases a day."
+            )
+
+        if not country_waves.empty:
+            several = int((country_waves['waves'] >= 2).sum())
+            insights.append(
+                f"**Waves by Country**: {several} of {len(country_waves)} countries had two or more waves, "
+                f"a median of {country_waves['waves'].median():.0f} per country."
+            )
+
+            intense = country_waves.take(rank_positions(country_waves['largest_peak_per_million'], 3))
+            if not intense.empty:
+                names = [f"{location} ({row['largest_peak_per_million']:,.0f} per million, {row['largest_peak_date']:%b %Y})"
+                         for location, row in intense.iterrows()]
+                insights.append(f"**Most Intense Waves**: Relative to population, the highest daily peaks were in {join_names(names)}.")
+
+            recent = recent_waves(waves, countries)
+            if not recent.empty:
+                names = list(recent.index[rank_positions(recent['largest_peak_new_cases'], 5)])
+                insights.append(
+                    f"**Recent Waves**: {len(recent)} {'country' if len(recent) == 1 else 'countries'} had a wave peak in the {RECENT_WAVE_DAYS} days up to "
+                    f"{waves['latest_date']:%d %B %Y}, including {join_names(names)}."
+                )
 
-    /* Media queries for better responsiveness */
-    @media (max-width: 768px) {
-        .metric-value {
-            font-size: calc(16px + 1vw);
-        }
+        if insights:
+            st.markdown("### Key Insights from the COVID-19 Data Analysis\n\n" + "\n\n".join(
+                f"{i}. {insight}" for i, insight in enumerate(insights, start=1)
+            ))
+        else:
+            st.info("Not enough data to derive insights.")
+
+        if not country_waves.empty:
+            with st.expander("Wave timing and intensity by country"):
+                table = country_waves.rename(columns={
+                    'continent': 'Continent',
+                    'waves': 'Waves',
+                    'largest_peak_date': 'Largest Peak',
+                    'largest_peak_new_cases': 'Peak New Cases (14-day avg)',
+                    'largest_peak_per_million': 'Peak per Million',
+                    'latest_peak_date': 'Latest Peak'
+                })
+                st.dataframe(table, use_container_width=True)
+    except Exception as e:
+        st.error(f"Error deriving insights: {str(e)}")
 
-        .metric-icon {
-            font-size: 24px;
-        }
+# Per-stage timings of this rerun, switched on from the performance metrics panel
+recorder = StageRecorder(
+    enabled=st.session_state.get('debug_metrics', False),
+    trace_memory=st.session_state.get('debug_trace_memory', False)
+)
 
-        .metric-label {
-            font-size: 14px;
-        }
+# Load the data
+try:
+    with recorder.stage('load_data') as record:
+        df = load_data()
+        record['rows'] = len(df)
+except Exception as e:
+    st.error(f"Failed to load data: {str(e)}")
+    st.stop()
 
-        .metric-desc {
-            font-size: 12px;
-        }
+# Dataset-wide figures, computed once per data version
+summary = recorder.measure('summary', lambda: get_aggregate(derived_aggregates(), df, 'summary', dataset_summary))
 
-        .metric-card {
-            padding: 10px 5px;
-        }
-    }
-</style>
-""", unsafe_allow_html=True)
+# Sidebar filters
+st.sidebar.header("Filters")
 
-# Create custom metric cards with animations - use responsive layout
-col1, col2 = st.columns(2)
-col3, col4 = st.columns(2)
+# Date range filter
+min_date = summary['min_date']
+max_date = summary['max_date']
+start_date, end_date = st.sidebar.date_input(
+    "Select Date Range",
+    [min_date, max_date],
+    min_value=min_date,
+    max_value=max_date
+)
 
-with col1:
-    if global_totals['total_cases'] is not None:
-        st.markdown(f"""
-        <div class="metric-card cases-card">
-            <div class="metric-icon">🦠</div>
-            <div class="metric-label">TOTAL CASES</div>
-            <div class="metric-value">{global_totals['total_cases']:,.0f}</div>
-            <div class="metric-desc">Confirmed infections worldwide</div>
-        </div>
-        """, unsafe_allow_html=True)
-    else:
-        st.markdown("""
-        <div class="metric-card cases-card">
-            <div class="metric-icon">🦠</div>
-            <div class="metric-label">TOTAL CASES</div>
-            <div class="metric-value">Data not available</div>
-        </div>
-        """, unsafe_allow_html=True)
+# Convert back to datetime for filtering
+start_date = pd.to_datetime(start_date)
+end_date = pd.to_datetime(end_date)
 
-with col2:
-    if global_totals['total_deaths'] is not None:
-        st.markdown(f"""
-        <div class="metric-card deaths-card">
-            <div class="metric-icon">💔</div>
-            <div class="metric-label">TOTAL DEATHS</div>
-            <div class="metric-value">{global_totals['total_deaths']:,.0f}</div>
-            <div class="metric-desc">Lives lost to COVID-19</div>
-        </div>
-        """, unsafe_allow_html=True)
-    else:
-        st.markdown("""
-        <div class="metric-card deaths-card">
-            <div class="metric-icon">💔</div>
-            <div class="metric-label">TOTAL DEATHS</div>
-            <div class="metric-value">Data not available</div>
-        </div>
-        """, unsafe_allow_html=True)
+# Countries, continents and the world, with the totals of each level, built once per data version
+hierarchy = recorder.measure('hierarchy', lambda: get_aggregate(derived_aggregates(), df, 'hierarchy', build_hierarchy))
 
-with col3:
-    if global_totals['total_cases'] is not None and global_totals['total_deaths'] is not None and global_totals['total_cases'] > 0:
-        death_rate = (global_totals['total_deaths'] / global_totals['total_cases'] * 100).round(2)
-        st.markdown(f"""
-        <div class="metric-card rate-card">
-            <div class="metric-icon">📊</div>
-            <div class="metric-label">DEATH RATE</div>
-            <div class="metric-value">{death_rate}%</div>
-            <div class="metric-desc">Case fatality ratio</div>
-        </div>
-        """, unsafe_allow_html=True)
-    else:
-        st.markdown("""
-        <div class="metric-card rate-card">
-            <div class="metric-icon">📊</div>
-            <div class="metric-label">DEATH RATE</div>
-            <div class="metric-value">Data not available</div>
-        </div>
-        """, unsafe_allow_html=True)
+# Continent filter; the overview totals and the country list follow it
+continent = st.sidebar.selectbox("Select Continent", [WORLD] + sorted(hierarchy['members']))
 
-with col4:
-    if global_totals['people_vaccinated'] is not None:
-        st.markdown(f"""
-        <div class="metric-card vax-card">
-            <div class="metric-icon">💉</div>
-            <div class="metric-label">VACCINATED</div>
-            <div class="metric-value">{global_totals['people_vaccinated']:,.0f}</div>
-            <div class="metric-desc">People with at least one dose</div>
-        </div>
-        """, unsafe_allow_html=True)
-    else:
-        st.markdown("""
-        <div class="metric-card vax-card">
-            <div class="metric-icon">💉</div>
-            <div class="metric-label">VACCINATED</div>
-            <div class="metric-value">Data not available</div>
-        </div>
-        """, unsafe_allow_html=True)
+# Country selection
+all_countries = summary['locations'] if continent == WORLD else level_members(hierarchy, [continent])
+default_countries = ['United States', 'India', 'Brazil', 'United Kingdom', 'Russia', 'France', 'Germany', 'South Africa', 'Kenya', 'China']
+default_countries = [c for c in default_countries if c in all_countries]  # Ensure defaults exist in the data
 
-# Add a separator with animation
-st.markdown("""
-<div style="margin: 30px 0; text-align: center; overflow: hidden;">
-    <div style="display: inline-block; position: relative; animation: fadeIn 1s ease-out forwards; animation-delay: 0.9s; opacity: 0;">
-        <hr style="width: 100px; display: inline-block; border: none; height: 2px; background: linear-gradient(90deg, transparent, rgba(30, 60, 114, 0.5), transparent);">
-        <span style="margin: 0 15px; color: #555; position: relative; top: -3px;">UPDATED DATA</span>
-        <hr style="width: 100px; display: inline-block; border: none; height: 2px; background: linear-gradient(90deg, transparent, rgba(30, 60, 114, 0.5), transparent);">
-    </div>
-</div>
-""", unsafe_allow_html=True)
+selected_countries = st.sidebar.multiselect(
+    "Select Countries",
+    all_countries,
+    default=default_countries
+)
 
-# World map visualization
-st.header("Global COVID-19 Map")
-st.markdown("""
-This interactive map shows the global distribution of COVID-19 metrics.
-Select a metric from the dropdown below to visualize its distribution across countries.
-Hover over countries to see detailed information.
-""")
-
-# Select metric for the map
-map_metric = st.selectbox(
-    "Select Metric for World Map",
+# Metric selection
+selected_metrics = st.sidebar.multiselect(
+    "Select Metrics to Display",
     list(available_metrics.keys()),
-    index=0
+    default=['Total Cases', 'Total Deaths', 'Death Rate (%)', 'People Vaccinated (%)']
 )
 
-map_metric_col = available_metrics[map_metric]
-
-# Create a choropleth map
-if map_metric_col in latest_global.columns:
-    try:
-        # Make sure iso_code column exists
-        if 'iso_code' not in latest_global.columns:
-            st.warning("ISO country codes are missing in the dataset, which are required for the world map visualization.")
-        else:
-            # Check if there are any valid iso_code values
-            has_valid_iso = latest_global['iso_code'].notna().any()
-
-            if not has_valid_iso:
-                st.warning("No valid ISO country codes found in the dataset.")
-            else:
-                # Determine which columns to include in the hover data
-                hover_columns = [map_metric_col]
-                for col in ['total_cases', 'total_deaths', 'death_rate']:
-                    if col in latest_global.columns:
-                        hover_columns.append(col)
+# Section selection; hidden sections are not computed at all
+all_sections = ['Global Overview', 'World Map', 'Country Comparison', 'Time Series Analysis', 'Vaccination Progress']
+visible_sections = st.sidebar.multiselect(
+    "Sections to Display",
+    all_sections,
+    default=all_sections
+)
 
-                # Create a copy of the dataframe with only the necessary columns
-                # First, create a list of columns that exist in the dataframe
-                available_cols = ['iso_code', 'location']
-                for col in [map_metric_col] + hover_columns:
-                    if col not in available_cols and col in latest_global.columns:
-                        available_cols.append(col)
+# Memory footprint of the loaded columns compared to the full dataset
+report = memory_report(df, DATA_FILE) if os.path.exists(DATA_FILE) else None
+if report is not None:
+    st.sidebar.caption(
+        f"Dataset in memory: {report['loaded_bytes'] / 1e6:,.1f} MB "
+        f"({report['loaded_columns']} of {report['source_columns']} columns, "
+        f"{report['saved_bytes'] / 1e6:,.1f} MB saved, "
+        f"{shared_bytes(df) / 1e6:,.1f} MB shared between server processes)"
+    )
+
+# Freshness of the dataset kept by the background refresher
+refresh_status = dataset_refresher().status()
+if refresh_status['checked_at'] is not None:
+    st.sidebar.caption(f"Checked for dataset updates at {datetime.fromtimestamp(refresh_status['checked_at']):%Y-%m-%d %H:%M}")
+if refresh_status['fetch_error']:
+    st.sidebar.caption(f"Could not check for dataset updates: {refresh_status['fetch_error']}. Using the local copy.")
+if st.sidebar.button("Check for updates now"):
+    dataset_refresher().request_refresh()
+
+# Lazy data pipeline for this selection: each stage runs only when a visible section needs it
+serve_version(df.attrs.get('data_version'))
+pipeline = DashboardPipeline(
+    df,
+    start_date,
+    end_date,
+    selected_countries,
+    aggregates=derived_aggregates(),
+    views=view_cache(),
+    figures=figure_cache(),
+    recorder=recorder,
+    continent=continent
+)
 
-                # Create the map data with only available columns
-                map_data = latest_global[available_cols].copy()
+if 'Global Overview' in visible_sections:
+    section_fragment('overview', render_overview, pipeline)
 
-                # Remove rows with missing iso_code or the selected metric
-                map_data = map_data.dropna(subset=['iso_code', map_metric_col])
+if 'World Map' in visible_sections:
+    section_fragment('world_map', render_world_map, pipeline)
 
-                if map_data.empty:
-                    st.warning(f"No data available for {map_metric} with valid ISO codes.")
-                else:
-                    # Create the choropleth map
-                    fig = px.choropleth(
-                        map_data,
-                        locations="iso_code",
-                        color=map_metric_col,
-                        hover_name="location",
-                        hover_data=hover_columns,
-                        color_continuous_scale="Viridis",
-                        title=f"Global {map_metric} Distribution"
-                    )
-                    # Make the map larger for better visibility
-                    fig.update_layout(height=700, margin={"r":0,"t":30,"l":0,"b":0})
-                    st.plotly_chart(fig, use_container_width=True)
-    except Exception as e:
-        st.error(f"Error creating the map visualization: {str(e)}")
-        # Print more detailed error information for debugging
-        import traceback
-        st.error(f"Detailed error: {traceback.format_exc()}")
-else:
-    st.warning(f"Data for {map_metric} is not available for the world map visualization.")
-
-# Country comparison
+# Country comparison and time series need at least one selected country
 if selected_countries:
-    st.header("Country Comparison")
-
-    try:
-        # Get the latest data for selected countries
-        latest_selected = latest_global[latest_global['location'].isin(selected_countries)]
-
-        if not latest_selected.empty:
-            # Sort by total cases if available, otherwise use the first column
-            if 'total_cases' in latest_selected.columns:
-                latest_selected = latest_selected.sort_values('total_cases', ascending=False)
-
-            # Create a bar chart for selected metrics
-            for metric_name in selected_metrics:
-                metric_col = available_metrics[metric_name]
-                if metric_col in latest_selected.columns and latest_selected[metric_col].notna().any():
-                    try:
-                        fig = px.bar(
-                            latest_selected,
-                            x='location',
-                            y=metric_col,
-                            title=f"{metric_name} by Country (Latest Data)",
-                            color='location',
-                            labels={metric_col: metric_name, 'location': 'Country'}
-                        )
-                        fig.update_layout(xaxis_tickangle=-45)
-                        st.plotly_chart(fig, use_container_width=True)
-                    except Exception as e:
-                        st.error(f"Error creating bar chart for {metric_name}: {str(e)}")
-                else:
-                    st.warning(f"Data for {metric_name} is not available for some or all selected countries.")
-
-            # Time series analysis
-            st.header("Time Series Analysis")
-
-            # Create time series plots for selected metrics
-            for metric_name in selected_metrics:
-                metric_col = available_metrics[metric_name]
-                if metric_col in filtered_df.columns and filtered_df[metric_col].notna().any():
-                    try:
-                        # Filter data for selected countries and remove rows with NaN values for the metric
-                        time_series_df = filtered_df[filtered_df['location'].isin(selected_countries)].dropna(subset=[metric_col])
-
-                        if not time_series_df.empty:
-                            fig = px.line(
-                                time_series_df,
-                                x='date',
-                                y=metric_col,
-                                color='location',
-                                title=f"{metric_name} Over Time",
-                                labels={metric_col: metric_name, 'date': 'Date', 'location': 'Country'}
-                            )
-                            fig.update_layout(xaxis_tickangle=-45)
-                            st.plotly_chart(fig, use_container_width=True)
-                        else:
-                            st.warning(f"No time series data available for {metric_name} for the selected countries.")
-                    except Exception as e:
-                        st.error(f"Error creating time series chart for {metric_name}: {str(e)}")
-                else:
-                    st.warning(f"Time series data for {metric_name} is not available for some or all selected countries.")
-        else:
-            st.warning("No data available for the selected countries.")
-    except Exception as e:
-        st.error(f"Error in country comparison: {str(e)}")
-
-
-
-# Vaccination progress
-st.header("Vaccination Progress")
-
-try:
-    # Check if vaccination data column exists
-    if 'people_vaccinated_per_hundred' in filtered_df.columns:
-        # Filter countries with vaccination data
-        vax_df = filtered_df.dropna(subset=['people_vaccinated_per_hundred'])
-        vax_countries = vax_df['location'].unique()
-
-        if len(vax_countries) > 0:
-            # Get the latest vaccination data
-            latest_vax = vax_df.sort_values('date').groupby('location').tail(1)
-            latest_vax = latest_vax.sort_values('people_vaccinated_per_hundred', ascending=False)
-
-            # Create a bar chart for vaccination rates
-            try:
-                fig = px.bar(
-                    latest_vax,
-                    x='location',
-                    y='people_vaccinated_per_hundred',
-                    title="Vaccination Rate by Country (% of Population)",
-                    color='location',
-                    labels={'people_vaccinated_per_hundred': 'People Vaccinated (%)', 'location': 'Country'}
-                )
-                fig.update_layout(xaxis_tickangle=-45)
-                st.plotly_chart(fig, use_container_width=True)
-            except Exception as e:
-                st.error(f"Error creating vaccination rate chart: {str(e)}")
-
-            # Create a time series plot for vaccination progress
-            if selected_countries:
-                try:
-                    vax_time_df = vax_df[vax_df['location'].isin(selected_countries)]
-                    if not vax_time_df.empty:
-                        fig = px.line(
-                            vax_time_df,
-                            x='date',
-                            y='people_vaccinated_per_hundred',
-                            color='location',
-                            title="Vaccination Progress Over Time (% of Population)",
-                            labels={'people_vaccinated_per_hundred': 'People Vaccinated (%)', 'date': 'Date', 'location': 'Country'}
-                        )
-                        fig.update_layout(xaxis_tickangle=-45)
-                        st.plotly_chart(fig, use_container_width=True)
-                    else:
-                        st.warning("No vaccination data available for the selected countries.")
-                except Exception as e:
-                    st.error(f"Error creating vaccination progress chart: {str(e)}")
-        else:
-            st.warning("Vaccination data is not available for the selected countries or time period.")
-    else:
-        st.warning("Vaccination data (people_vaccinated_per_hundred) is not available in the dataset.")
-except Exception as e:
-    st.error(f"Error processing vaccination data: {str(e)}")
-
-# Insights and conclusions
-st.header("Key Insights")
-st.markdown("""
-### Key Insights from the COVID-19 Data Analysis
-
-1. **Global Case Distribution**: The United States, India, and Brazil have consistently reported the highest number of COVID-19 cases globally, indicating the severity of the pandemic in these regions.
-
-2. **Death Rate Variations**: Despite having high case numbers, some countries have managed to maintain lower death rates, suggesting differences in healthcare capacity, testing strategies, and population demographics.
-
-3. **Vaccination Progress**: Countries like the United Kingdom and the United States have achieved higher vaccination rates compared to others, demonstrating the disparity in vaccine distribution and administration globally.
+    if 'Country Comparison' in visible_sections:
+        section_fragment('country_comparison', render_country_comparison, pipeline, selected_metrics)
+    if 'Time Series Analysis' in visible_sections:
+        section_fragment('time_series', render_time_series, pipeline, selected_metrics)
 
-4. **Waves of Infection**: The data reveals multiple waves of infection across different countries, with varying timing and intensity, highlighting the dynamic nature of the pandemic and the influence of public health measures.
+if 'Vaccination Progress' in visible_sections:
+    section_fragment('vaccination', render_vaccination, pipeline)
 
-5. **Correlation Between Measures**: There appears to be a correlation between early vaccination rollout and reduced death rates in subsequent waves, suggesting the effectiveness of vaccines in mitigating the severity of the pandemic.
-""")
+# Insights computed from the data
+section_fragment('insights', render_insights, pipeline)
 
+# Stage timings and cache counters
+stage_metrics().record(recorder.finish())
+render_debug_panel(recorder)
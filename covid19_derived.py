@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+
+# Metrics derived from the source columns, keyed by display name. They are computed for every
+# location in one vectorised pass when the dataset is ingested and stored with it, so each one
+# costs a rerun no more than any other stored column. To add one, name it here and compute it
+# in derive_metrics().
+DERIVED_METRICS = {
+    'New Cases (7-day avg)': 'new_cases_avg_7',
+    'New Cases (14-day avg)': 'new_cases_avg_14',
+    'New Deaths (7-day avg)': 'new_deaths_avg_7',
+    'New Deaths (14-day avg)': 'new_deaths_avg_14',
+    'Case Growth Rate (% per day)': 'case_growth_rate',
+    'Case Doubling Time (days)': 'case_doubling_days',
+    'Total Cases per Million': 'total_cases_per_million',
+    'Total Deaths per Million': 'total_deaths_per_million',
+    'New Cases per Million (7-day avg)': 'new_cases_avg_7_per_million',
+    'New Deaths per Million (7-day avg)': 'new_deaths_avg_7_per_million'
+}
+
+# Source columns the derived metrics are computed from
+DERIVED_INPUTS = ['new_cases', 'new_deaths', 'total_cases', 'total_deaths', 'population']
+
+# Days over which the growth rate of total cases is measured
+GROWTH_DAYS = 7
+
+# Longest doubling time reported; slower growth is effectively flat
+MAX_DOUBLING_DAYS = 365
+
+# Days averaged by the rolling averages
+AVERAGE_DAYS = [7, 14]
+
+# Days before a row that its derived metrics can depend on, besides the report just before them
+LOOKBACK_DAYS = max(AVERAGE_DAYS + [GROWTH_DAYS + 1])
+
+# Day numbers of different locations are kept this far apart in the sort keys
+LOCATION_SPAN = 1 << 32
+
+
+# Rows of every location's series as sorted (location, day) keys, and the order that sorts the frame
+def series_keys(df):
+    codes, _ = pd.factorize(df['location'], sort=False)
+    days = df['date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    keys = codes.astype(np.int64) * LOCATION_SPAN + days
+    order = np.argsort(keys, kind='stable')
+    return keys[order], order
+
+
+# First row of each row's window: same location, at most days - 1 days earlier
+def window_starts(keys, days):
+    return np.searchsorted(keys, keys - (days - 1), side='left')
+
+
+# Days each row's new_* values cover: the gap since the location's previous report, or for its
+# first report the gap to the next one. 1 for daily data; 7 or about 30 for weekly or monthly reports.
+def report_days(keys):
+    gaps = np.diff(keys).astype('float64')
+    gaps[(gaps < 1) | (gaps >= LOCATION_SPAN // 2)] = np.nan
+    before = np.concatenate([[np.nan], gaps])
+    after = np.concatenate([gaps, [np.nan]])
+    return np.where(np.isnan(before), np.where(np.isnan(after), 1.0, after), before)
+
+
+# Rows needed to derive the rows dated on or after `since` (one date per row, NaT to derive the
+# whole series): those within LOOKBACK_DAYS of it, and the report just before them, whose gap and
+# total the earliest window needs. Deriving only these gives the same values for the new rows as
+# deriving every row.
+def derivation_rows(df, since):
+    keys, order = series_keys(df)
+    days = keys % LOCATION_SPAN
+    since = np.asarray(since).astype('datetime64[D]')[order]
+    whole = np.isnat(since)
+    first = np.where(whole, 0, since.astype(np.int64)) - (LOOKBACK_DAYS - 1)
+    needed = whole | (days >= first)
+
+    before = np.flatnonzero(~needed[:-1] & needed[1:])
+    needed[before[keys[before + 1] - keys[before] < LOCATION_SPAN // 2]] = True
+
+    rows = np.empty(len(order), dtype=bool)
+    rows[order] = needed
+    return rows
+
+
+# Mean of the reported values in each row's trailing calendar window, from running sums,
+# so gaps in the reporting shrink the window rather than shifting it
+def rolling_mean(values, starts):
+    present = ~np.isnan(values)
+    sums = np.concatenate([[0.0], np.cumsum(np.where(present, values, 0.0))])
+    counts = np.concatenate([[0], np.cumsum(present)])
+    stops = np.arange(1, len(values) + 1)
+    count = counts[stops] - counts[starts]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, (sums[stops] - sums[starts]) / count, np.nan)
+
+
+# Every derived metric for every row, as float32 columns aligned with the frame
+def derive_metrics(df):
+    keys, order = series_keys(df)
+    column = {col: df[col].to_numpy(dtype='float64', na_value=np.nan)[order] for col in DERIVED_INPUTS}
+    derived = {}
+
+    # Averages are per day whatever the reporting period, so a weekly or monthly report
+    # counts as that many days at its daily rate
+    days = report_days(keys)
+    for window in AVERAGE_DAYS:
+        starts = window_starts(keys, window)
+        derived[f'new_cases_avg_{window}'] = rolling_mean(column['new_cases'] / days, starts)
+        derived[f'new_deaths_avg_{window}'] = rolling_mean(column['new_deaths'] / days, starts)
+
+    # Compound daily growth of total cases since the earliest report in the last GROWTH_DAYS days,
+    # or since the previous report when the location reports less often than that
+    rows = np.arange(len(keys))
+    starts = window_starts(keys, GROWTH_DAYS + 1)
+    same_location = np.concatenate([[False], np.diff(keys) < LOCATION_SPAN // 2])
+    starts = np.where((starts == rows) & same_location, rows - 1, starts)
+    span = (keys - keys[starts]).astype('float64')
+    total = column['total_cases']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        growth = np.where((span > 0) & (total[starts] > 0), (total / total[starts]) ** (1 / span) - 1, np.nan)
+        derived['case_growth_rate'] = growth * 100
+        doubling = np.log(2) / np.log1p(growth)
+        derived['case_doubling_days'] = np.where((growth > 0) & (doubling <= MAX_DOUBLING_DAYS), doubling, np.nan)
+
+        millions = column['population'] / 1e6
+        derived['total_cases_per_million'] = total / millions
+        derived['total_deaths_per_million'] = column['total_deaths'] / millions
+        derived['new_cases_avg_7_per_million'] = derived['new_cases_avg_7'] / millions
+        derived['new_deaths_avg_7_per_million'] = derived['new_deaths_avg_7'] / millions
+
+    # Back to the frame's row order, without the infinities of a zero population or total
+    inverse = np.empty_like(order)
+    inverse[order] = np.arange(len(order))
+    return {
+        col: np.where(np.isfinite(derived[col]), derived[col], np.nan)[inverse].astype('float32')
+        for col in DERIVED_METRICS.values()
+    }
+
+
+def add_derived_metrics(df):
+    for col, values in derive_metrics(df).items():
+        df[col] = values
+    return df
@@ -0,0 +1,99 @@
+import numpy as np
+
+# Most points drawn for one series; about one per horizontal pixel of a wide chart
+SERIES_POINTS = 1000
+
+# Most points drawn for a whole chart, shared out between its series
+CHART_POINTS = 20000
+
+# Fewest points a series is reduced to, however many series share the chart
+MIN_SERIES_POINTS = 100
+
+
+# Largest-triangle-three-buckets: keeps the first and last points and, from each bucket in
+# between, the point forming the largest triangle with the previous pick and the next bucket's mean.
+# Positions into x/y, sorted. Buckets are set up in one pass; only the pick loop is per bucket.
+def lttb_indices(x, y, threshold):
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    edges = np.floor(np.arange(threshold - 1) * every).astype(np.int64) + 1
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:n - 1], edges[:-1]) / counts
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+# Min/max bucketing: the smallest and largest value of each bucket, plus the end points.
+# Keeps every peak and trough exactly; fully vectorised.
+def minmax_indices(x, y, threshold):
+    n = len(y)
+    if threshold >= n or threshold < 4:
+        return np.arange(n)
+
+    buckets = (threshold - 2) // 2
+    size = -(-n // buckets)
+    lows = np.full(buckets * size, np.inf)
+    highs = np.full(buckets * size, -np.inf)
+    lows[:n] = highs[:n] = y
+    offsets = np.arange(buckets) * size
+    picks = np.concatenate([
+        [0, n - 1],
+        offsets + lows.reshape(buckets, size).argmin(axis=1),
+        offsets + highs.reshape(buckets, size).argmax(axis=1)
+    ])
+    return np.unique(picks[picks < n])
+
+
+DOWNSAMPLERS = {
+    'lttb': lttb_indices,
+    'minmax': minmax_indices
+}
+
+
+# Points to keep per series so a chart of series_count series stays within the budgets
+def series_threshold(series_count, series_points=SERIES_POINTS, chart_points=CHART_POINTS):
+    return max(MIN_SERIES_POINTS, min(series_points, chart_points // max(series_count, 1)))
+
+
+# Reduce every series of a long-format frame (one series per group, ordered by x) to a bounded
+# number of points before it is charted. Frames already within budget are returned unchanged.
+# With several y columns, each column is reduced over its own non-missing values and the
+# rows any of them keeps are returned together.
+# Min/max is the default since it keeps every peak and runs without a per-bucket loop.
+def downsample_frame(data, x='date', y=None, group='location', method='minmax',
+                     series_points=SERIES_POINTS, chart_points=CHART_POINTS):
+    groups = data.groupby(group, observed=True, sort=False).indices
+    threshold = series_threshold(len(groups), series_points, chart_points)
+    if all(len(positions) <= threshold for positions in groups.values()):
+        return data
+
+    pick = DOWNSAMPLERS[method]
+    x_values = data[x].to_numpy()
+    if np.issubdtype(x_values.dtype, np.datetime64):
+        x_values = (x_values - x_values.min()) / np.timedelta64(1, 'D')
+    x_values = x_values.astype(np.float64)
+
+    keep = []
+    for column in [y] if isinstance(y, str) else y:
+        y_values = data[column].to_numpy(dtype=np.float64)
+        present = ~np.isnan(y_values)
+        for positions in groups.values():
+            positions = positions[present[positions]]
+            if len(positions) > threshold:
+                positions = positions[pick(x_values[positions], y_values[positions], threshold)]
+            keep.append(positions)
+    return data.take(np.unique(np.concatenate(keep)))
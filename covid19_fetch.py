@@ -0,0 +1,118 @@
+import json
+import os
+
+import requests
+
+# Size of the blocks streamed from the response to disk
+CHUNK_SIZE = 1024 * 1024
+
+
+# Paths of the in-progress download and the saved HTTP validators for a target file
+def fetch_paths(file_path):
+    return file_path + '.part', file_path + '.http.json'
+
+
+def read_fetch_state(file_path):
+    _, state_path = fetch_paths(file_path)
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_fetch_state(file_path, state):
+    _, state_path = fetch_paths(file_path)
+    tmp_path = f'{state_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+# ETag and Last-Modified headers of a response
+def response_validators(response):
+    return {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified')
+    }
+
+
+# Validator usable in If-Range: a strong ETag, or else Last-Modified
+def range_validator(validators):
+    etag = validators.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return validators.get('last_modified')
+
+
+def build_request_headers(file_path, state, offset):
+    headers = {}
+    partial = state.get('partial') or {}
+
+    if offset and range_validator(partial):
+        # Resume the interrupted download, or get the whole file if it changed meanwhile
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = range_validator(partial)
+        headers['Accept-Encoding'] = 'identity'
+    elif os.path.exists(file_path):
+        # Revalidate the local copy
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+    return headers
+
+
+# First byte position of a 206 response, or None if the header is missing or malformed
+def content_range_start(response):
+    content_range = response.headers.get('Content-Range', '')
+    try:
+        return int(content_range.split()[1].split('-')[0])
+    except (IndexError, ValueError):
+        return None
+
+
+# Download url to file_path, streaming to disk, resuming partial downloads and
+# skipping the transfer when the server reports the local copy is current.
+# Returns True if file_path was replaced with a new version.
+def fetch_dataset(url, file_path, timeout=30, chunk_size=CHUNK_SIZE, session=None):
+    part_path, _ = fetch_paths(file_path)
+    state = read_fetch_state(file_path)
+    if state.get('url') != url:
+        state = {'url': url}
+
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = build_request_headers(file_path, state, offset)
+
+    http = session or requests
+    with http.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 304:
+            return False
+
+        # The server cannot serve the rest of the partial download (the file shrank since) or
+        # answered a different range than asked: drop the partial download and start over
+        unsatisfiable = response.status_code == 416 or (response.status_code == 206 and content_range_start(response) != offset)
+        if offset and unsatisfiable:
+            response.close()
+            os.remove(part_path)
+            state.pop('partial', None)
+            write_fetch_state(file_path, state)
+            return fetch_dataset(url, file_path, timeout, chunk_size, session)
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            mode = 'ab'
+        else:
+            mode = 'wb'
+            state['partial'] = response_validators(response)
+            write_fetch_state(file_path, state)
+
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+
+    # Swap the complete download in atomically and remember its validators
+    os.replace(part_path, file_path)
+    state.update(state.pop('partial', {}))
+    write_fetch_state(file_path, state)
+    return True
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+# Top of the location hierarchy
+WORLD = 'World'
+
+# Aggregate locations that carry no continent in datasets without a continent column
+EXCLUDED_FROM_TOTALS = ['World', 'International']
+
+# Metrics summed into the world and continent totals
+TOTAL_COLUMNS = ['total_cases', 'total_deaths', 'new_cases', 'new_deaths', 'total_vaccinations', 'people_vaccinated']
+
+
+# OWID_* codes of real countries and territories, counted like any other country
+OWID_COUNTRY_CODES = ['OWID_KOS', 'OWID_CYN']
+
+
+# Rows describing a single country. OWID aggregate rows (World, continents, income groups) have
+# no continent, sub-national regions have ISO 3166-2 style codes, and OWID_* codes are aggregates
+# or parts of a country (OWID_ENG, OWID_SCT, ...) even when they carry a continent, apart from
+# the OWID_COUNTRY_CODES.
+def country_mask(frame):
+    iso_codes = frame['iso_code'].astype(object).fillna('')
+    mask = ~frame['location'].isin(EXCLUDED_FROM_TOTALS) & ~iso_codes.str.contains('-', regex=False)
+    mask &= ~iso_codes.str.startswith('OWID_') | iso_codes.isin(OWID_COUNTRY_CODES)
+    if 'continent' in frame.columns and frame['continent'].notna().any():
+        mask &= frame['continent'].notna()
+    return mask.to_numpy()
+
+
+# Location hierarchy country -> continent -> world, with per-date totals of every level.
+# Cumulative metrics carry each country's last reported value forward, so a country that
+# skips a day still counts; new_* metrics sum what was reported on the day.
+# Built once per data version, after which any level's latest totals are a dict lookup.
+def build_hierarchy(df):
+    # Classify locations once each rather than once per row
+    labels = df[[col for col in ['location', 'iso_code', 'continent'] if col in df.columns]]
+    labels = labels.drop_duplicates('location', keep='last')
+    labels = labels[country_mask(labels)]
+    if 'continent' in labels.columns and labels['continent'].notna().any():
+        continents = labels['continent'].astype(str)
+    else:
+        continents = pd.Series(WORLD, index=labels.index)
+
+    parents = dict(zip(labels['location'].astype(str), continents))
+    members = {}
+    for country, continent in sorted(parents.items()):
+        members.setdefault(continent, []).append(country)
+    members.pop(WORLD, None)
+    countries = df[df['location'].isin(list(parents))]
+
+    # One (date x country) table per metric, filled by position, then summed per continent
+    dates = np.sort(countries['date'].unique())
+    order = sorted(parents)
+    rows = np.searchsorted(dates, countries['date'].to_numpy())
+    cols = pd.Index(order).get_indexer(countries['location'].astype(str))
+    column_parents = np.array([parents[country] for country in order])
+    levels = sorted(members)
+    series = {level: pd.DataFrame(index=pd.DatetimeIndex(dates, name='date')) for level in [WORLD] + levels}
+    for col in TOTAL_COLUMNS:
+        if col not in countries.columns:
+            continue
+        wide = np.full((len(dates), len(order)), np.nan)
+        wide[rows, cols] = countries[col].to_numpy(dtype='float64')
+        if not col.startswith('new_'):
+            wide = pd.DataFrame(wide).ffill().to_numpy()
+        wide = np.nan_to_num(wide)
+
+        series[WORLD][col] = wide.sum(axis=1)
+        for level in levels:
+            series[level][col] = wide[:, column_parents == level].sum(axis=1)
+
+    return {
+        'parents': parents,
+        'members': members,
+        'series': series,
+        'totals': {level: level_totals(frame) for level, frame in series.items()}
+    }
+
+
+# Latest totals of one level as a dict, None for metrics missing from the dataset
+def level_totals(frame, date=None):
+    if date is not None:
+        frame = frame.loc[:pd.Timestamp(date)]
+    last = frame.iloc[-1] if len(frame) else pd.Series(dtype='float64')
+    return {col: last[col] if col in last.index else None for col in TOTAL_COLUMNS}
+
+
+# Totals of a level (WORLD or a continent), as of a date or for the latest data
+def hierarchy_totals(hierarchy, level=WORLD, date=None):
+    if date is None:
+        return hierarchy['totals'][level]
+    return level_totals(hierarchy['series'][level], date)
+
+
+# Countries of the given continents, or every country
+def level_members(hierarchy, levels=None):
+    if not levels or WORLD in levels:
+        return sorted(hierarchy['parents'])
+    return sorted(country for level in levels for country in hierarchy['members'].get(level, []))
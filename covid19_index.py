@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+from covid19_store import CATEGORY_COLUMNS, KEY_COLUMNS, METRIC_COLUMNS
+
+# Latest non-null value of every metric per location, and the date each value was reported.
+# Built once per data version, so reruns never sort or group the full dataset.
+def build_snapshot(df):
+    value_columns = [col for col in CATEGORY_COLUMNS + METRIC_COLUMNS if col in df.columns and col != 'location']
+    ordered = df if df['date'].is_monotonic_increasing else df.sort_values('date', kind='stable')
+    groups = ordered.groupby('location', observed=True, sort=True)
+
+    # groupby().last() skips missing values, giving the latest reported value per column
+    values = groups[value_columns].last()
+    values['date'] = groups['date'].max()
+
+    metric_dates = pd.DataFrame(
+        {col: ordered['date'].where(ordered[col].notna()) for col in METRIC_COLUMNS if col in df.columns}
+    )
+    metric_dates['location'] = ordered['location']
+    dates = metric_dates.groupby('location', observed=True, sort=True).last()
+
+    return finish_snapshot(values, dates)
+
+
+# After a refresh appended the rows dated since `since`, take the latest values among those rows
+# and keep the previous ones where they reported nothing
+def update_snapshot(snapshot, df, since):
+    recent = build_snapshot(df[df['date'] >= pd.Timestamp(since)])
+    values = recent['values'].combine_first(snapshot['values'])[snapshot['values'].columns]
+    dates = recent['dates'].combine_first(snapshot['dates'])[snapshot['dates'].columns]
+    return finish_snapshot(values.astype(snapshot['values'].dtypes), dates.astype(snapshot['dates'].dtypes))
+
+
+def finish_snapshot(values, dates):
+    # A few hundred rows, so plain labels are cheaper than keeping categories aligned across versions
+    values.index = values.index.astype(str)
+    dates.index = dates.index.astype(str)
+    values, dates = values.sort_index(), dates.sort_index()
+    for col in values.columns:
+        if isinstance(values[col].dtype, pd.CategoricalDtype):
+            values[col] = values[col].astype(object)
+    return {
+        'values': values,
+        'dates': dates,
+        'latest': values.rename_axis('location').reset_index()
+    }
+
+
+# Latest value of one metric per location, optionally restricted to some locations and
+# to values reported on or after start. Matches a groupby over rows filtered to [start, max date].
+def latest_metric(snapshot, column, locations=None, start=None):
+    dates = snapshot['dates'][column]
+    mask = dates.notna()
+    if start is not None:
+        mask &= dates >= start
+    if locations:
+        mask &= dates.index.isin(locations)
+
+    latest = snapshot['values'].loc[mask, ['iso_code', column]]
+    latest['date'] = dates[mask]
+    return latest.rename_axis('location').reset_index()
+
+
+# Dataset sorted by location then date, with the row range of every location.
+# Selecting countries and a date range then takes a few binary searches instead of full-column scans.
+def build_series_index(df):
+    ordered = df.sort_values(KEY_COLUMNS, kind='stable', ignore_index=True)
+    locations = ordered['location'].astype('category')
+    codes = locations.cat.codes.to_numpy()
+
+    starts = np.flatnonzero(np.diff(codes, prepend=-1))
+    stops = np.append(starts[1:], len(codes))
+    labels = locations.cat.categories[codes[starts]].astype(str)
+
+    return {
+        'frame': ordered,
+        'dates': ordered['date'].to_numpy(),
+        'bounds': dict(zip(labels, zip(starts, stops)))
+    }
+
+
+# Row range [lo, hi) of one location restricted to start <= date <= end
+def series_bounds(index, location, start=None, end=None):
+    lo, hi = index['bounds'][location]
+    dates = index['dates'][lo:hi]
+    if start is not None:
+        lo = lo + np.searchsorted(dates, np.datetime64(start), side='left')
+        dates = index['dates'][lo:hi]
+    if end is not None:
+        hi = lo + np.searchsorted(dates, np.datetime64(end), side='right')
+    return lo, hi
+
+
+# Rows of the given locations (all if none) within the date range, as a single frame.
+# Costs O(locations * log rows) to locate plus the size of the result to gather. Ranges that
+# touch are merged, so one location, or neighbouring locations over their whole history, come
+# back as a view of the index frame; anything else is gathered into one copy, which the chart
+# stages reduce further anyway.
+def select_rows(index, locations=None, start=None, end=None):
+    locations = index['bounds'] if not locations else [loc for loc in locations if loc in index['bounds']]
+    ranges = []
+    for lo, hi in sorted(series_bounds(index, location, start, end) for location in locations):
+        if hi <= lo:
+            continue
+        if ranges and ranges[-1][1] == lo:
+            ranges[-1] = (ranges[-1][0], hi)
+        else:
+            ranges.append((lo, hi))
+    if len(ranges) == 1:
+        lo, hi = ranges[0]
+        return index['frame'].iloc[lo:hi]
+
+    positions = np.concatenate([np.arange(lo, hi) for lo, hi in ranges]) if ranges else np.array([], dtype=np.int64)
+    return index['frame'].take(positions)
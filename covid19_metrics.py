@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+# Rows in a stage result: frames and series, or the sorted frame of a series index
+def result_rows(result):
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return len(result)
+    if isinstance(result, dict) and isinstance(result.get('frame'), pd.DataFrame):
+        return len(result['frame'])
+    return None
+
+
+# Wall time, rows and peak allocation of the named stages of one rerun.
+# A disabled recorder runs stages directly, so instrumented code costs a method call when off.
+# Memory tracing uses tracemalloc, which is process-wide and slows allocations down,
+# so it is a separate switch and peaks overlap when several sessions trace at once.
+class StageRecorder:
+    def __init__(self, enabled=False, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.records = []
+        self.stack = []
+        self.started_tracing = False
+        self.finished = False
+
+    # Context manager timing a block; set record['rows'] inside it when known
+    def stage(self, name, rows=None):
+        if not self.enabled:
+            return nullcontext({})
+        return self.measure_block(name, rows)
+
+    # Run compute() as a named stage and return its result
+    def measure(self, name, compute):
+        if not self.enabled:
+            return compute()
+        with self.measure_block(name) as record:
+            result = compute()
+            record['rows'] = result_rows(result)
+        return result
+
+    @contextmanager
+    def measure_block(self, name, rows=None):
+        record = {'stage': name, 'seconds': None, 'rows': rows, 'peak_bytes': None}
+        frame = self.enter_memory()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            record['peak_bytes'] = self.exit_memory(frame)
+            self.records.append(record)
+
+    def enter_memory(self):
+        if not self.trace_memory:
+            return None
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+        # Resetting the peak for this stage must not hide the enclosing stage's peak so far
+        current, peak = tracemalloc.get_traced_memory()
+        if self.stack:
+            self.stack[-1]['child_peak'] = max(self.stack[-1]['child_peak'], peak)
+        tracemalloc.reset_peak()
+        frame = {'start': current, 'child_peak': current}
+        self.stack.append(frame)
+        return frame
+
+    # Bytes allocated above the starting level at the stage's peak
+    def exit_memory(self, frame):
+        if frame is None:
+            return None
+        self.stack.pop()
+        if not tracemalloc.is_tracing():
+            return None
+        peak = max(tracemalloc.get_traced_memory()[1], frame['child_peak'])
+        if self.stack:
+            self.stack[-1]['child_peak'] = max(self.stack[-1]['child_peak'], peak)
+        return peak - frame['start']
+
+    # Stop tracing memory if this recorder started it
+    def finish(self):
+        if self.started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.started_tracing = False
+        self.finished = True
+        return self.records
+
+
+# Per-stage totals over every recorded rerun, shared by all sessions
+class StageMetrics:
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def record(self, records):
+        with self.lock:
+            for record in records:
+                stage = self.stages.setdefault(record['stage'], {
+                    'calls': 0,
+                    'seconds': 0.0,
+                    'rows': 0,
+                    'last_seconds': 0.0,
+                    'peak_bytes': None
+                })
+                stage['calls'] += 1
+                stage['seconds'] += record['seconds']
+                stage['last_seconds'] = record['seconds']
+                if record['rows'] is not None:
+                    stage['rows'] += record['rows']
+                if record['peak_bytes'] is not None:
+                    stage['peak_bytes'] = max(stage['peak_bytes'] or 0, record['peak_bytes'])
+
+    def snapshot(self):
+        with self.lock:
+            return {name: dict(stage) for name, stage in self.stages.items()}
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Stage totals, and optionally cache counters keyed by cache name, in the Prometheus text format
+def prometheus_text(stages, caches=None):
+    families = [
+        ('covid19_stage_calls_total', 'counter', 'Times each dashboard stage ran.', 'calls'),
+        ('covid19_stage_seconds_total', 'counter', 'Wall time spent in each dashboard stage.', 'seconds'),
+        ('covid19_stage_rows_total', 'counter', 'Rows produced by each dashboard stage.', 'rows'),
+        ('covid19_stage_last_seconds', 'gauge', 'Wall time of the latest run of each dashboard stage.', 'last_seconds'),
+        ('covid19_stage_peak_bytes', 'gauge', 'Largest peak allocation seen in each dashboard stage.', 'peak_bytes')
+    ]
+    lines = []
+    for metric, kind, help_text, field in families:
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} {kind}']
+        for name, stage in sorted(stages.items()):
+            if stage[field] is not None:
+                lines.append(f'{metric}{{stage="{escape_label(name)}"}} {stage[field]}')
+
+    cache_fields = [('hits', 'counter'), ('misses', 'counter'), ('evictions', 'counter'), ('entries', 'gauge'), ('bytes', 'gauge')]
+    for field, kind in cache_fields if caches else []:
+        metric = f'covid19_cache_{field}_total' if kind == 'counter' else f'covid19_cache_{field}'
+        lines += [f'# HELP {metric} Cache {field} of each shared cache.', f'# TYPE {metric} {kind}']
+        for name, stats in sorted(caches.items()):
+            lines.append(f'{metric}{{cache="{escape_label(name)}"}} {stats[field]}')
+    return '\n'.join(lines) + '\n'
+
+
+# Write the metrics for a textfile collector, replacing the previous file atomically
+def write_prometheus(path, text):
+    with open(path + '.tmp', 'w') as f:
+        f.write(text)
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,556 @@
+import string
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.colors import qualitative
+
+from covid19_cache import selection_key
+from covid19_downsample import downsample_frame
+from covid19_hierarchy import WORLD, build_hierarchy, hierarchy_totals
+from covid19_index import build_series_index, build_snapshot, latest_metric, select_rows, update_snapshot
+from covid19_metrics import StageRecorder
+from covid19_ranking import RANK_SIZE, rank_order, rank_page
+from covid19_rollup import build_rollup, choose_resolution, update_rollup
+from covid19_store import HOVER_COLUMNS, METRIC_COLUMNS, REQUIRED_COLUMNS, add_derived_columns, load_store, read_owid_csv
+from covid19_waves import build_waves
+
+# The dashboard data path as importable stages: load -> derive -> filter -> aggregate -> chart.
+# Nothing here touches Streamlit, and every stage after loading runs only when something asks for it.
+
+
+# Load stage: required columns the source CSV lacks
+def missing_source_columns(file_path):
+    source_columns = pd.read_csv(file_path, nrows=0).columns
+    return [col for col in REQUIRED_COLUMNS if col not in source_columns]
+
+
+# Load stage: read the typed columnar store, converting the CSV only when it has changed
+def read_dataset(file_path):
+    try:
+        return load_store(file_path)
+    except ImportError:
+        # No Parquet engine available, parse the CSV with the same column and dtype hints
+        return read_owid_csv(file_path)
+
+
+# Countries the sample data starts with; real ISO codes so the map works properly
+SAMPLE_COUNTRIES = [
+    ('United States', 'USA', 'North America'),
+    ('India', 'IND', 'Asia'),
+    ('Brazil', 'BRA', 'South America'),
+    ('United Kingdom', 'GBR', 'Europe'),
+    ('Russia', 'RUS', 'Europe'),
+    ('Germany', 'DEU', 'Europe'),
+    ('France', 'FRA', 'Europe'),
+    ('Italy', 'ITA', 'Europe'),
+    ('Spain', 'ESP', 'Europe'),
+    ('China', 'CHN', 'Asia')
+]
+
+CONTINENTS = ['Africa', 'Asia', 'Europe', 'North America', 'Oceania', 'South America']
+
+# Period of each sample data frequency, and its length in days
+SAMPLE_FREQUENCIES = {'daily': ('D', 1), 'weekly': ('W-SUN', 7), 'monthly': ('MS', 30.4)}
+
+
+# Three-letter codes AAA, AAB, ... for synthetic locations
+def synthetic_codes(count):
+    letters = np.array(list(string.ascii_uppercase))
+    index = np.arange(count)
+    return np.char.add(np.char.add(letters[index // 676 % 26], letters[index // 26 % 26]), letters[index % 26])
+
+
+# Load stage: synthetic dataset used when the real one cannot be loaded, and for demos and load tests.
+# Generates whole (location x period) arrays at once; the same seed always gives the same data.
+# Beyond the sample countries, locations get synthetic codes, and regions adds that many
+# sub-national regions per location.
+def create_sample_data(locations=len(SAMPLE_COUNTRIES), freq='monthly', start='2020-01-01', end='2023-01-01',
+                       seed=None, regions=0):
+    rng = np.random.default_rng(seed)
+    period, period_days = SAMPLE_FREQUENCIES[freq]
+    dates = pd.date_range(start=start, end=end, freq=period)
+
+    countries = SAMPLE_COUNTRIES[:locations]
+    codes = synthetic_codes(locations - len(countries))
+    countries += [(f"Country {code}", code, CONTINENTS[i % len(CONTINENTS)]) for i, code in enumerate(codes)]
+    names, iso_codes, continents = (list(col) for col in zip(*countries)) if countries else ([], [], [])
+    for region in range(1, regions + 1):
+        names += [f"{country[0]} Region {region}" for country in countries]
+        iso_codes += [f"{country[1]}-{region:02d}" for country in countries]
+        continents += [country[2] for country in countries]
+
+    n_locations, n_periods = len(names), len(dates)
+    population = rng.uniform(1e5, 3e8, n_locations)
+    day = (dates - dates[0]).days.to_numpy()
+
+    # Waves of infection: three gaussian peaks per location, in cases per period
+    peaks = rng.uniform(0, max(day[-1], 1) if n_periods else 1, (n_locations, 3))
+    widths = rng.uniform(20, 60, (n_locations, 3))
+    heights = rng.uniform(1e-5, 1e-3, (n_locations, 3)) * population[:, None]
+    intensity = (heights[:, :, None] * np.exp(-((day - peaks[:, :, None]) / widths[:, :, None]) ** 2)).sum(axis=1)
+    new_cases = rng.poisson((intensity + 1) * period_days).astype(np.float64)
+    new_deaths = rng.binomial(new_cases.astype(np.int64), rng.uniform(0.005, 0.03, (n_locations, 1))).astype(np.float64)
+
+    # Vaccination follows a logistic curve from about a year in, with some unreported periods
+    rollout = rng.uniform(400, 600, (n_locations, 1))
+    vax_share = rng.uniform(40, 95, (n_locations, 1)) / (1 + np.exp(-(day - rollout) / 60))
+    vax_share[:, day < 350] = np.nan
+    vax_share[rng.random((n_locations, n_periods)) < 0.1] = np.nan
+    people_vaccinated = vax_share / 100 * population[:, None]
+
+    sample = pd.DataFrame({
+        'date': np.tile(dates.values, n_locations),
+        'location': pd.Categorical(np.repeat(names, n_periods)),
+        'iso_code': pd.Categorical(np.repeat(iso_codes, n_periods)),
+        'continent': pd.Categorical(np.repeat(continents, n_periods)),
+        'total_cases': new_cases.cumsum(axis=1).ravel(),
+        'new_cases': new_cases.ravel(),
+        'total_deaths': new_deaths.cumsum(axis=1).ravel(),
+        'new_deaths': new_deaths.ravel(),
+        'total_vaccinations': (people_vaccinated * rng.uniform(1.6, 2.4, (n_locations, 1))).ravel(),
+        'people_vaccinated': people_vaccinated.ravel(),
+        'people_fully_vaccinated': (people_vaccinated * 0.85).ravel(),
+        'people_vaccinated_per_hundred': vax_share.ravel(),
+        'people_fully_vaccinated_per_hundred': (vax_share * 0.85).ravel(),
+        'population': np.repeat(population, n_periods)
+    })
+    for col in METRIC_COLUMNS:
+        if col in sample.columns:
+            sample[col] = sample[col].astype('float32')
+    return add_derived_columns(sample)
+
+
+# Derive stage: dataset-wide figures shown in the overview cards
+def dataset_summary(df):
+    return {
+        'locations': sorted(df['location'].dropna().astype(str).unique()),
+        'min_date': df['date'].min().date(),
+        'max_date': df['date'].max().date(),
+        'rows': len(df)
+    }
+
+
+# Derive stage: get an aggregate of the dataset, built once per data version.
+# After an incremental refresh, update() patches the previous version with the rows appended since changed_since.
+def get_aggregate(aggregates, df, name, build, update=None):
+    version = df.attrs.get('data_version')
+    if version is None:
+        return build(df)
+
+    cached = aggregates.get(name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    changed_since = df.attrs.get('changed_since')
+    if update is not None and cached is not None and cached[0] == df.attrs.get('previous_version') and changed_since is not None:
+        aggregate = update(cached[1], df, changed_since)
+    else:
+        aggregate = build(df)
+    aggregates[name] = (version, aggregate)
+    return aggregate
+
+
+# Chart stage: figure builders.
+# plotly.express and plotly.subplots take a noticeable part of a cold start, so the builders
+# import them on the first chart that needs them rather than when the server starts.
+def make_map_figure(map_data, metric_col, hover_columns, title):
+    import plotly.express as px
+
+    fig = px.choropleth(
+        map_data,
+        locations="iso_code",
+        color=metric_col,
+        hover_name="location",
+        hover_data=hover_columns,
+        color_continuous_scale="Viridis",
+        title=title
+    )
+    # Make the map larger for better visibility
+    fig.update_layout(height=700, margin={"r":0,"t":30,"l":0,"b":0})
+    return fig
+
+
+# Ranked bars as a single trace coloured by value, rather than one trace per country.
+# Hovering shows each country's rank, counted from first_rank.
+def make_ranked_bar_figure(data, metric_col, title, labels, first_rank=1):
+    values = data[metric_col].to_numpy()
+    x_label = labels.get('location', 'location')
+    y_label = labels.get(metric_col, metric_col)
+
+    fig = go.Figure(go.Bar(
+        x=data['location'].astype(str).to_numpy(),
+        y=values,
+        customdata=np.arange(first_rank, first_rank + len(data)),
+        marker={'color': values, 'colorscale': 'Viridis'},
+        hovertemplate=f"#%{{customdata}} %{{x}}<br>{y_label}=%{{y}}<extra></extra>"
+    ))
+    fig.update_layout(title=title, xaxis_title=x_label, yaxis_title=y_label, xaxis_tickangle=-45)
+    return fig
+
+
+# Points above which line charts are drawn with WebGL instead of SVG
+WEBGL_POINTS = 5000
+
+
+# Row ranges of each series in a frame ordered by series, as (labels, starts, stops).
+# Frames whose series are not contiguous are given a stable order by series first.
+def series_runs(data, group='location'):
+    codes, labels = pd.factorize(data[group], sort=False)
+    starts = np.flatnonzero(np.diff(codes, prepend=-1))
+    if len(starts) != len(labels):
+        order = np.argsort(codes, kind='stable')
+        data, codes = data.take(order), codes[order]
+        starts = np.flatnonzero(np.diff(codes, prepend=-1))
+    stops = np.append(starts[1:], len(codes))
+    return data, labels[codes[starts]], starts, stops
+
+
+# One line trace per country, sliced straight from contiguous arrays rather than through
+# plotly-express's per-trace groupby. Traces of one country share a legend group and colour.
+def line_traces(x, y, runs, trace_type, hover, showlegend=True):
+    locations, starts, stops = runs
+    colors = qualitative.Plotly
+    return [
+        trace_type(
+            x=x[start:stop],
+            y=y[start:stop],
+            mode='lines',
+            name=str(location),
+            legendgroup=str(location),
+            showlegend=showlegend,
+            connectgaps=True,
+            line={'color': colors[i % len(colors)]},
+            hovertemplate=hover.replace('{location}', str(location))
+        )
+        for i, (location, start, stop) in enumerate(zip(locations, starts, stops))
+    ]
+
+
+# Line chart of one metric, switched to Scattergl once there are many points
+def make_line_figure(data, metric_col, title, labels, webgl_points=WEBGL_POINTS):
+    data, *runs = series_runs(data)
+    x_label = labels.get('date', 'date')
+    y_label = labels.get(metric_col, metric_col)
+    location_label = labels.get('location', 'location')
+    trace_type = go.Scattergl if len(data) > webgl_points else go.Scatter
+
+    fig = go.Figure(data=line_traces(
+        data['date'].to_numpy(),
+        data[metric_col].to_numpy(),
+        runs,
+        trace_type,
+        f"{location_label}={{location}}<br>{x_label}=%{{x}}<br>{y_label}=%{{y}}<extra></extra>"
+    ))
+    fig.update_layout(
+        title=title,
+        xaxis_title=x_label,
+        yaxis_title=y_label,
+        legend_title_text=location_label,
+        xaxis_tickangle=-45
+    )
+    return fig
+
+
+# Empty figure with one stacked subplot per metric; metrics are (column, display name) pairs
+def make_metric_grid(metrics, title, row_height, shared_xaxes=False):
+    from plotly.subplots import make_subplots
+
+    rows = len(metrics)
+    fig = make_subplots(
+        rows=rows,
+        cols=1,
+        shared_xaxes=shared_xaxes,
+        subplot_titles=[name for _, name in metrics],
+        vertical_spacing=min(0.12, 0.3 / rows)
+    )
+    fig.update_layout(title=title, height=row_height * rows + 100)
+    fig.update_xaxes(tickangle=-45)
+    return fig
+
+
+# Latest values of the selected countries, one bar subplot per metric, in a single figure.
+# Each subplot is one trace coloured by country, with the same colours in every subplot.
+def make_bar_grid_figure(data, metrics, title):
+    fig = make_metric_grid(metrics, title, row_height=350)
+    colors = qualitative.Plotly
+    locations = data['location'].astype(str).to_numpy()
+    marker_colors = [colors[i % len(colors)] for i in range(len(locations))]
+
+    for row, (metric_col, metric_name) in enumerate(metrics, start=1):
+        fig.add_trace(go.Bar(
+            x=locations,
+            y=data[metric_col].to_numpy(),
+            name=metric_name,
+            marker_color=marker_colors,
+            showlegend=False,
+            hovertemplate=f"Country=%{{x}}<br>{metric_name}=%{{y}}<extra></extra>"
+        ), row=row, col=1)
+    return fig
+
+
+# Selected metrics over time, one line subplot per metric sharing the date axis, in a single figure.
+# Country runs are found once for all metrics; the legend toggles a country in every subplot.
+def make_line_grid_figure(data, metrics, title, webgl_points=WEBGL_POINTS):
+    data, *runs = series_runs(data)
+    fig = make_metric_grid(metrics, title, row_height=400, shared_xaxes=True)
+    trace_type = go.Scattergl if len(data) * len(metrics) > webgl_points else go.Scatter
+    x = data['date'].to_numpy()
+
+    for row, (metric_col, metric_name) in enumerate(metrics, start=1):
+        fig.add_traces(line_traces(
+            x,
+            data[metric_col].to_numpy(),
+            runs,
+            trace_type,
+            f"Country={{location}}<br>Date=%{{x}}<br>{metric_name}=%{{y}}<extra></extra>",
+            showlegend=row == 1
+        ), rows=row, cols=1)
+    fig.update_layout(legend_title_text='Country')
+    return fig
+
+
+# Build the dataset-wide aggregates of a new data version ahead of the first request that needs them
+def warm_aggregates(df, aggregates):
+    pipeline = DashboardPipeline(df, df['date'].min(), df['date'].max(), aggregates=aggregates)
+    for name in ['summary', 'series_index', 'snapshot', 'hierarchy', 'waves']:
+        getattr(pipeline, name)
+    for resolution in ['weekly', 'monthly']:
+        pipeline.rollup(resolution)
+    return aggregates
+
+
+# Drop the cached views and figures of every other data version. A cached slice is sized
+# without the frame it points into, so it would otherwise keep a whole old version alive.
+def discard_other_versions(caches, version):
+    for cache in caches:
+        cache.discard(lambda key: version not in key)
+
+
+# Lazy pipeline for one rerun's selection. Each property runs its stage on first access only,
+# so sections that are not rendered cost nothing. Passing the shared caches (a dict for
+# per-version aggregates, LRUCaches for views and figures) lets reruns and sessions reuse work.
+# An enabled StageRecorder times every stage that actually computes, not the cache hits.
+class DashboardPipeline:
+    def __init__(self, df, start_date, end_date, countries=None, aggregates=None, views=None, figures=None,
+                 recorder=None, continent=None):
+        self.df = df
+        self.start_date = pd.Timestamp(start_date)
+        self.end_date = pd.Timestamp(end_date)
+        # Sorted like the cache keys, so any order of the same countries gets the same rows in the same order
+        self.countries = sorted(countries or [])
+        self.continent = continent or WORLD
+        self.version = df.attrs.get('data_version')
+        self.aggregates = {} if aggregates is None else aggregates
+        self.views = views
+        self.figures = figures
+        self.recorder = recorder or StageRecorder()
+        self.selection = selection_key(self.version, self.start_date, self.end_date, self.countries)
+        # Latest-value results do not depend on the date range
+        self.latest_selection = (self.version, tuple(self.countries))
+
+    # Run compute() through a shared cache when the data has a version, directly otherwise.
+    # The stage is named after the first key part only: metrics, pages and other selection
+    # details stay in the cache key, so the stage names (and metric labels) are a fixed set.
+    def cached(self, cache, key, compute, selection=None, stage=None):
+        stage = stage or key[0]
+
+        def measured():
+            return self.recorder.measure(stage, compute)
+
+        if cache is None or self.version is None:
+            return measured()
+        selection = self.selection if selection is None else selection
+        return cache.get_or_compute(key + selection, measured)
+
+    # Derive stage
+    def aggregate(self, name, build, update=None):
+        def measured_build(df):
+            return self.recorder.measure(f'build:{name}', lambda: build(df))
+
+        def measured_update(aggregate, df, changed_since):
+            return self.recorder.measure(f'update:{name}', lambda: update(aggregate, df, changed_since))
+
+        return get_aggregate(self.aggregates, self.df, name, measured_build, update and measured_update)
+
+    @cached_property
+    def summary(self):
+        return self.aggregate('summary', dataset_summary)
+
+    @cached_property
+    def series_index(self):
+        return self.aggregate('series_index', build_series_index)
+
+    @cached_property
+    def snapshot(self):
+        return self.aggregate('snapshot', build_snapshot, update_snapshot)
+
+    # Filter stage
+    @cached_property
+    def filtered(self):
+        return self.cached(self.views, ('filtered',), lambda: select_rows(
+            self.series_index, self.countries, self.start_date, self.end_date
+        ))
+
+    # Coarsest of daily, weekly and monthly rows that still draws the date range in enough points
+    @cached_property
+    def resolution(self):
+        return choose_resolution(self.start_date, self.end_date)
+
+    # Weekly or monthly rollup of every location, built once per data version
+    def rollup(self, resolution):
+        return self.aggregate(
+            f'rollup_{resolution}',
+            lambda df: build_rollup(df, resolution),
+            lambda index, df, changed_since: update_rollup(index, df, changed_since, resolution)
+        )
+
+    # Rows of the selection at the chart resolution, for the time series charts
+    @cached_property
+    def chart_rows(self):
+        if self.resolution == 'daily':
+            return self.filtered
+        return self.cached(self.views, ('chart_rows',), lambda: select_rows(
+            self.rollup(self.resolution), self.countries, self.start_date, self.end_date
+        ))
+
+    # Rows of the selection with a value for any of the metrics, selected in one pass for all of them
+    def metric_series(self, metric_cols):
+        metric_cols = [col for col in metric_cols if col in self.chart_rows.columns]
+        return self.cached(self.views, ('metric_series',) + tuple(metric_cols), lambda: (
+            self.chart_rows[['location', 'date'] + metric_cols].dropna(subset=metric_cols, how='all')
+        ))
+
+    # Aggregate stage
+    @cached_property
+    def latest_global(self):
+        return self.snapshot['latest']
+
+    # Country -> continent -> world hierarchy with the totals of every level
+    @cached_property
+    def hierarchy(self):
+        return self.aggregate('hierarchy', build_hierarchy)
+
+    # Waves of infection of every country, continent and the world, found once per data version
+    @cached_property
+    def waves(self):
+        return self.aggregate('waves', lambda df: build_waves(df, self.hierarchy))
+
+    @cached_property
+    def global_totals(self):
+        # Latest totals of the world or the selected continent, summed over countries only
+        return hierarchy_totals(self.hierarchy, self.continent)
+
+    # Latest data for the selected countries, ranked by total cases
+    @cached_property
+    def latest_selected(self):
+        def compute():
+            latest = self.latest_global[self.latest_global['location'].isin(self.countries)]
+            if 'total_cases' in latest.columns:
+                latest = latest.take(rank_order(latest['total_cases']))
+            return latest
+        return self.cached(self.views, ('latest_selected',), compute, self.latest_selection)
+
+    # Number of comparison pages of RANK_SIZE countries
+    @cached_property
+    def comparison_pages(self):
+        return max(1, -(-len(self.latest_selected) // RANK_SIZE))
+
+    # Latest data with the columns the map needs, for locations with an ISO code and a value
+    def map_data(self, metric_col):
+        hover_columns = [metric_col] + [col for col in HOVER_COLUMNS if col in self.latest_global.columns]
+        available_cols = ['iso_code', 'location']
+        for col in hover_columns:
+            if col not in available_cols and col in self.latest_global.columns:
+                available_cols.append(col)
+
+        map_data = self.latest_global[available_cols].dropna(subset=['iso_code', metric_col])
+        return map_data, hover_columns
+
+    @cached_property
+    def vaccination(self):
+        return self.cached(self.views, ('vaccination',), lambda: self.filtered.dropna(subset=['people_vaccinated_per_hundred']))
+
+    @cached_property
+    def vaccination_series(self):
+        if self.resolution == 'daily':
+            return self.vaccination
+        return self.cached(self.views, ('vaccination_series',), lambda: self.chart_rows.dropna(subset=['people_vaccinated_per_hundred']))
+
+    # Latest vaccination rate per country, straight from the snapshot when the range reaches the latest date
+    @cached_property
+    def latest_vaccination(self):
+        def compute():
+            if self.end_date.date() >= self.summary['max_date']:
+                latest = latest_metric(self.snapshot, 'people_vaccinated_per_hundred', self.countries, self.start_date)
+            else:
+                latest = self.vaccination.sort_values('date').groupby('location', observed=True).tail(1)
+            return latest
+        return self.cached(self.views, ('latest_vaccination',), compute)
+
+    # One page of countries ranked by vaccination rate, highest first unless ascending
+    def vaccination_ranking(self, page=0, ascending=False):
+        return self.cached(self.views, ('vaccination_ranking', page, ascending), lambda: rank_page(
+            self.latest_vaccination, 'people_vaccinated_per_hundred', page, RANK_SIZE, ascending
+        ))
+
+    # Chart stage: long series reduced to a bounded number of points per chart, keeping peaks
+    def chart_series(self, data, metric_cols):
+        return self.recorder.measure('downsample', lambda: downsample_frame(data, 'date', metric_cols))
+
+    # Figures are cached under their kind plus whatever else they depend on, and timed per kind
+    def figure(self, kind, details, build, selection=None):
+        return self.cached(self.figures, (kind,) + details, build, selection, f'figure:{kind}')
+
+    def map_figure(self, metric_col, metric_name):
+        # Depends on the metric and the data version only, so every selection shares it
+        def build():
+            map_data, hover_columns = self.map_data(metric_col)
+            return make_map_figure(map_data, metric_col, hover_columns, f"Global {metric_name} Distribution")
+        return self.figure('choropleth', (metric_col,), build, (self.version,))
+
+    # All selected metrics in one figure of stacked subplots; metrics are (column, display name) pairs.
+    # Countries are shown RANK_SIZE at a time in order of total cases.
+    def comparison_figure(self, metrics, page=0):
+        page = min(max(page, 0), self.comparison_pages - 1)
+        return self.figure('bar_grid', (page,) + tuple(col for col, _ in metrics), lambda: make_bar_grid_figure(
+            self.latest_selected.iloc[page * RANK_SIZE:(page + 1) * RANK_SIZE],
+            metrics,
+            "Selected Metrics by Country (Latest Data)"
+        ), self.latest_selection)
+
+    # Chart titles name the resolution when the data is rolled up
+    def chart_title(self, title):
+        return title if self.resolution == 'daily' else f"{title} ({self.resolution.title()})"
+
+    def time_series_figure(self, metrics):
+        metric_cols = [col for col, _ in metrics]
+        return self.figure('line_grid', tuple(metric_cols), lambda: make_line_grid_figure(
+            self.chart_series(self.metric_series(metric_cols), metric_cols),
+            metrics,
+            self.chart_title("Selected Metrics Over Time")
+        ))
+
+    # One page of the vaccination ranking as a single bar trace
+    def vaccination_bar_figure(self, page=0, ascending=False):
+        def build():
+            ranking = self.vaccination_ranking(page, ascending)
+            last_rank = ranking['first_rank'] + len(ranking['frame']) - 1
+            order = 'Lowest' if ascending else 'Highest'
+            return make_ranked_bar_figure(
+                ranking['frame'],
+                'people_vaccinated_per_hundred',
+                f"Vaccination Rate by Country (% of Population): {order} {ranking['first_rank']}-{last_rank} of {ranking['ranked']}",
+                {'people_vaccinated_per_hundred': 'People Vaccinated (%)', 'location': 'Country'},
+                ranking['first_rank']
+            )
+        return self.figure('vaccination_bar', (page, ascending), build)
+
+    def vaccination_line_figure(self):
+        return self.figure('vaccination_line', (), lambda: make_line_figure(
+            self.chart_series(self.vaccination_series, ['people_vaccinated_per_hundred']),
+            'people_vaccinated_per_hundred',
+            self.chart_title("Vaccination Progress Over Time (% of Population)"),
+            {'people_vaccinated_per_hundred': 'People Vaccinated (%)', 'date': 'Date', 'location': 'Country'}
+        ))
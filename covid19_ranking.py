@@ -0,0 +1,48 @@
+import numpy as np
+
+# Bars per page of a ranked chart
+RANK_SIZE = 20
+
+
+# Positions of the values ranked offset + 1 to offset + count, highest first unless ascending.
+# Equal values are ranked by position, so the pages of a ranking join into one stable sort.
+# Missing values are not ranked. A partition finds the value ranked offset + count in linear
+# time, so only the values up to it (every one equal to it included) are sorted rather than
+# every location.
+def rank_positions(values, count, offset=0, ascending=False):
+    values = np.asarray(values, dtype='float64')
+    valid = np.flatnonzero(~np.isnan(values))
+    keys = values[valid] if ascending else -values[valid]
+    end = min(offset + count, len(valid))
+    if end <= offset:
+        return np.array([], dtype=np.int64)
+
+    if end < len(valid):
+        front = np.flatnonzero(keys <= np.partition(keys, end - 1)[end - 1])
+    else:
+        front = np.arange(len(valid))
+    front = front[np.lexsort((front, keys[front]))]
+    return valid[front[offset:end]]
+
+
+# Every position in rank order, locations missing the value last
+def rank_order(values, ascending=False):
+    values = np.asarray(values, dtype='float64')
+    missing = np.flatnonzero(np.isnan(values))
+    return np.concatenate([rank_positions(values, len(values), 0, ascending), missing])
+
+
+# One page of a frame ranked by a column, with the rank of its first row and the page count
+def rank_page(frame, column, page=0, page_size=RANK_SIZE, ascending=False):
+    values = np.asarray(frame[column], dtype='float64')
+    ranked = int(np.count_nonzero(~np.isnan(values)))
+    pages = max(1, -(-ranked // page_size))
+    page = min(max(page, 0), pages - 1)
+    positions = rank_positions(values, page_size, page * page_size, ascending)
+    return {
+        'frame': frame.take(positions),
+        'first_rank': page * page_size + 1,
+        'page': page,
+        'pages': pages,
+        'ranked': ranked
+    }
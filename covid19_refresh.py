@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from covid19_fetch import fetch_dataset
+from covid19_pipeline import missing_source_columns, read_dataset
+from covid19_shared import open_shared, publish_shared
+from covid19_store import read_current_store, store_is_fresh
+
+# Seconds between checks for a new dataset, and between retries after a failed check
+REFRESH_INTERVAL = 3600
+RETRY_INTERVAL = 300
+
+
+# Held while a process downloads the dataset or reads and rebuilds its store. Every server process
+# runs its own refresher over the same files, so they take turns; the ones that wait then find the
+# store fresh and only map the shared copy. Without fcntl (Windows) there is no lock.
+@contextmanager
+def host_lock(file_path):
+    with open(file_path + '.lock', 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# Keeps the latest dataset in memory and prepares the next version on a background thread.
+# Readers always get the current frame straight away (stale-while-revalidate); the worker
+# downloads, parses and warms the new version off the request path, then swaps it in with a
+# single reference assignment. The frame is a read-only view of a memory-mapped file published
+# once per host, so every server process and session shares one copy.
+class DatasetRefresher:
+    def __init__(self, url, file_path, interval=REFRESH_INTERVAL, retry_interval=RETRY_INTERVAL, on_refresh=None):
+        self.url = url
+        self.file_path = file_path
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.on_refresh = on_refresh
+        self.data = None
+        self.error = None
+        self.fetch_error = None
+        self.refreshed_at = None
+        self.checked_at = None
+        self.thread = None
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+
+    # Serve the shared copy another process already published, if any, and start the worker once.
+    # Mapping the copy is cheap; reading the store is left to the worker.
+    def start(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return self
+            if self.data is None:
+                try:
+                    self.data = open_shared(self.file_path)
+                except (ImportError, OSError, ValueError):
+                    self.data = None
+            self.thread = threading.Thread(target=self.run, name='covid19-refresh', daemon=True)
+            self.thread.start()
+        return self
+
+    def run(self):
+        try:
+            current = self.data
+            if current is None:
+                # No shared copy yet: publish the store left by the last run, off the request path
+                os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+                with host_lock(self.file_path):
+                    current = read_current_store(self.file_path)
+                    current = None if current is None else publish_shared(current, self.file_path)
+            if current is not None and self.on_refresh is not None:
+                self.on_refresh(current)
+            if self.data is None:
+                self.data = current
+        except Exception as e:
+            self.error = str(e)
+        while True:
+            self.refresh()
+            self.wake.wait(self.retry_interval if self.error else self.interval)
+            self.wake.clear()
+
+    # Download and load the next version; on failure keep serving the current one
+    def refresh(self):
+        try:
+            os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+            with host_lock(self.file_path):
+                try:
+                    fetch_dataset(self.url, self.file_path)
+                    self.fetch_error = None
+                except (requests.exceptions.RequestException, OSError) as e:
+                    if not os.path.exists(self.file_path):
+                        raise
+                    # The local copy is still usable
+                    self.fetch_error = str(e)
+
+                missing_columns = missing_source_columns(self.file_path)
+                if missing_columns:
+                    raise ValueError(f"Dataset is missing required columns: {', '.join(missing_columns)}")
+
+                # Another process may already have published this version
+                df = open_shared(self.file_path) if store_is_fresh(self.file_path) else None
+                if df is None:
+                    df = publish_shared(read_dataset(self.file_path), self.file_path)
+            if self.data is None or df.attrs.get('data_version') != self.data.attrs.get('data_version'):
+                # Warm the new version before readers can see it, so no rerun after the swap
+                # pays for building its aggregates
+                if self.on_refresh is not None:
+                    self.on_refresh(df)
+                self.data = df
+                self.refreshed_at = time.time()
+            self.error = None
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.checked_at = time.time()
+
+    # Check for a new version now instead of waiting for the interval
+    def request_refresh(self):
+        self.wake.set()
+
+    def current(self):
+        return self.data
+
+    def status(self):
+        return {
+            'data_version': self.data.attrs.get('data_version') if self.data is not None else None,
+            'refreshed_at': self.refreshed_at,
+            'checked_at': self.checked_at,
+            'error': self.error,
+            'fetch_error': self.fetch_error,
+            'running': self.thread is not None and self.thread.is_alive()
+        }
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from covid19_index import build_series_index
+from covid19_store import CATEGORY_COLUMNS, DERIVED_COLUMNS, METRIC_COLUMNS, add_death_rate, unify_categories
+
+# Chart resolutions from finest to coarsest, with the days each point covers
+RESOLUTIONS = {'daily': 1, 'weekly': 7, 'monthly': 30.4}
+
+# Fewest points per series a chart should have; coarser resolutions are used while they still reach it
+MIN_CHART_POINTS = 48
+
+
+# Period number of every date: Monday-based weeks or calendar months
+def period_keys(dates, resolution):
+    days = dates.to_numpy().astype('datetime64[D]')
+    if resolution == 'weekly':
+        # 1970-01-01 was a Thursday
+        return (days.astype(np.int64) + 3) // 7
+    return days.astype('datetime64[M]').astype(np.int64)
+
+
+# One row per location and period, dated by the last reported day in the period.
+# new_* columns are summed over the period; cumulative, per-hundred and derived columns (rolling
+# averages, growth rates) take their last reported value, and death_rate is derived again from
+# the rolled-up totals.
+def build_rollup(df, resolution):
+    metrics = [col for col in METRIC_COLUMNS if col in df.columns and col != 'death_rate']
+    summed = [col for col in metrics if col.startswith('new_') and col not in DERIVED_COLUMNS]
+    last = [col for col in metrics if col not in summed] + [col for col in CATEGORY_COLUMNS if col in df.columns and col != 'location']
+
+    groups = df.groupby([df['location'], period_keys(df['date'], resolution)], observed=True, sort=True)
+    rollup = groups[last].last()
+    if summed:
+        rollup[summed] = groups[summed].sum(min_count=1)
+    rollup['date'] = groups['date'].max()
+    rollup = rollup.droplevel(1).reset_index()
+
+    if 'total_cases' in rollup.columns and 'total_deaths' in rollup.columns:
+        rollup = add_death_rate(rollup)
+    for col in metrics:
+        rollup[col] = rollup[col].astype('float32')
+    return build_series_index(rollup)
+
+
+# After a refresh appended the rows dated since `since`, roll up again only the periods from the
+# one containing it and keep the earlier ones
+def update_rollup(index, df, since, resolution):
+    first = period_keys(pd.Series([pd.Timestamp(since)]), resolution)[0]
+    frame = index['frame']
+    kept = frame[period_keys(frame['date'], resolution) < first].copy()
+    changed = build_rollup(df[period_keys(df['date'], resolution) >= first], resolution)['frame'].copy()
+    return build_series_index(pd.concat(unify_categories([kept, changed]), ignore_index=True))
+
+
+# Coarsest resolution that still gives a chart of the range MIN_CHART_POINTS points per series
+def choose_resolution(start, end, min_points=MIN_CHART_POINTS):
+    days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    chosen = 'daily'
+    for resolution, period_days in RESOLUTIONS.items():
+        if days / period_days >= min_points:
+            chosen = resolution
+    return chosen
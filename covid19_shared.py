@@ -0,0 +1,119 @@
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:
+    pa = pa_ipc = None
+
+from covid19_store import read_store_meta, store_is_compatible, store_paths
+
+# Frame attributes kept in the shared file's schema metadata
+ATTRS_KEY = b'covid19_attrs'
+
+
+# Path of the shared copy of one data version, next to the columnar store
+def shared_path(csv_path, data_version):
+    store_path, _ = store_paths(csv_path)
+    base, _ = os.path.splitext(store_path)
+    return f'{base}.{data_version}.arrow'
+
+
+# Arrow columns that map back to pandas without copying: float NaNs stay values rather than
+# nulls, so no validity bitmap has to be applied when the file is opened
+def arrow_column(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return pa.DictionaryArray.from_pandas(series.array)
+    return pa.array(series.to_numpy(), from_pandas=False)
+
+
+# Read-only copy of a frame that is not backed by the shared mapping (no pyarrow, no data
+# version, sample data). Each column gets its own read-only buffer, so a write into the values
+# raises, or under copy-on-write copies the column first, and never reaches another session.
+# Adding or replacing a column changes the frame object itself: hand out session_frame()s.
+def freeze_frame(df):
+    columns = {}
+    for col in df.columns:
+        values = df[col].array
+        if isinstance(values, pd.Categorical):
+            codes = values.codes.copy()
+            codes.flags.writeable = False
+            columns[col] = pd.Categorical.from_codes(codes, dtype=values.dtype)
+        else:
+            values = df[col].to_numpy(copy=True)
+            values.flags.writeable = False
+            columns[col] = values
+    frozen = pd.DataFrame(columns, index=df.index, copy=False)
+    frozen.attrs.update(df.attrs)
+    return frozen
+
+
+# Frame handed to one rerun: a shallow copy of the shared frame, so the columns a rerun adds or
+# replaces stay its own while every column still points at the same read-only buffers
+def session_frame(df):
+    return df.copy(deep=False)
+
+
+# Write the frame once per host as an uncompressed Arrow IPC file named after its data version,
+# then return the memory-mapped copy. Older versions are removed; processes that still map
+# them keep their pages until they let go. Frames that cannot be shared are returned frozen.
+def publish_shared(df, csv_path):
+    version = df.attrs.get('data_version')
+    if pa is None or version is None:
+        return freeze_frame(df)
+
+    path = shared_path(csv_path, version)
+    if not os.path.exists(path):
+        table = pa.table({col: arrow_column(df[col]) for col in df.columns})
+        table = table.replace_schema_metadata({ATTRS_KEY: json.dumps(df.attrs).encode()})
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa_ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+    for old_path in glob.glob(shared_path(csv_path, '*')):
+        if old_path != path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    shared = open_shared(csv_path, version)
+    return freeze_frame(df) if shared is None else shared
+
+
+# Read-only frame over the memory-mapped shared copy of a data version (the current one of a
+# store with the expected layout by default). Every process mapping the file shares the same page-cache pages.
+def open_shared(csv_path, data_version=None):
+    if pa is None:
+        return None
+    if data_version is None and store_is_compatible(csv_path):
+        data_version = (read_store_meta(csv_path) or {}).get('data_version')
+    path = shared_path(csv_path, data_version) if data_version else None
+    if path is None or not os.path.exists(path):
+        return None
+
+    try:
+        table = pa_ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+    df = table.to_pandas(split_blocks=True, self_destruct=False)
+    df.attrs.update(json.loads((table.schema.metadata or {}).get(ATTRS_KEY, b'{}')))
+    return df
+
+
+# Bytes of a frame's columns that live in the shared mapping rather than in this process
+def shared_bytes(df):
+    total = 0
+    for col in df.columns:
+        values = df[col].array
+        values = values.codes if isinstance(values, pd.Categorical) else np.asarray(values)
+        if not values.flags.writeable and values.base is not None:
+            total += values.nbytes
+    return total
@@ -0,0 +1,405 @@
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = pa_csv = None
+
+from covid19_derived import DERIVED_INPUTS, DERIVED_METRICS, add_derived_metrics, derivation_rows
+
+# Metrics offered in the dashboard, keyed by display name
+available_metrics = {
+    'Total Cases': 'total_cases',
+    'New Cases': 'new_cases',
+    'Total Deaths': 'total_deaths',
+    'New Deaths': 'new_deaths',
+    'Death Rate (%)': 'death_rate',
+    'Total Vaccinations': 'total_vaccinations',
+    'People Vaccinated': 'people_vaccinated',
+    'People Fully Vaccinated': 'people_fully_vaccinated',
+    'People Vaccinated (%)': 'people_vaccinated_per_hundred',
+    'People Fully Vaccinated (%)': 'people_fully_vaccinated_per_hundred'
+}
+available_metrics.update(DERIVED_METRICS)
+
+# Columns that must be present in the source CSV for the dashboard to work
+REQUIRED_COLUMNS = ['date', 'location', 'total_cases', 'total_deaths']
+
+# Extra columns shown when hovering over the world map
+HOVER_COLUMNS = ['total_cases', 'total_deaths', 'death_rate']
+
+# Columns the store computes itself instead of reading them from the source
+DERIVED_COLUMNS = ['death_rate'] + list(DERIVED_METRICS.values())
+
+CATEGORY_COLUMNS = ['location', 'iso_code', 'continent']
+
+# Columns identifying a row of the dataset
+KEY_COLUMNS = ['location', 'date']
+
+
+# Build the registry of columns the dashboard needs, mapped to their in-memory dtype
+def column_registry(metrics=None):
+    metrics = available_metrics if metrics is None else metrics
+
+    registry = {'date': 'datetime64'}
+    registry.update({col: 'category' for col in CATEGORY_COLUMNS})
+    for col in REQUIRED_COLUMNS + DERIVED_INPUTS + list(metrics.values()) + HOVER_COLUMNS:
+        if col not in registry:
+            registry[col] = 'float32'
+    return registry
+
+
+COLUMN_REGISTRY = column_registry()
+STORE_COLUMNS = list(COLUMN_REGISTRY)
+METRIC_COLUMNS = [col for col, dtype in COLUMN_REGISTRY.items() if dtype == 'float32']
+SOURCE_COLUMNS = [col for col in STORE_COLUMNS if col not in DERIVED_COLUMNS]
+
+# Bumped whenever the layout of the store or its metadata changes, or derived columns are computed differently
+STORE_VERSION = 8
+
+# Number of rows sampled when estimating the size of the full-width frame
+MEMORY_SAMPLE_ROWS = 10000
+
+# Parts appended by refreshes before the store is compacted back into one file
+MAX_STORE_PARTS = 30
+
+
+# Paths of the columnar store and its metadata file for a given source CSV
+def store_paths(csv_path):
+    base, _ = os.path.splitext(csv_path)
+    return base + '.parquet', base + '.meta.json'
+
+
+# Path of a part appended to the store by a refresh
+def store_part_path(csv_path, number):
+    store_path, _ = store_paths(csv_path)
+    base, _ = os.path.splitext(store_path)
+    return f'{base}.part{number}.parquet'
+
+
+# Fingerprint of the source file, used to detect when the store is stale
+def source_fingerprint(csv_path):
+    stat = os.stat(csv_path)
+    return {'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+
+
+# Identifier of the data a store holds, unique per source file state and store layout
+def version_id(fingerprint):
+    return '{source_size:x}-{source_mtime_ns:x}-{store_version}'.format(store_version=STORE_VERSION, **fingerprint)
+
+
+def read_store_meta(csv_path):
+    _, meta_path = store_paths(csv_path)
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_store_meta(csv_path, meta):
+    _, meta_path = store_paths(csv_path)
+    tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+# Whether the store exists and has the layout and columns this code expects
+def store_is_compatible(csv_path):
+    store_path, _ = store_paths(csv_path)
+    meta = read_store_meta(csv_path)
+    if meta is None or not os.path.exists(store_path):
+        return False
+    if meta.get('store_version') != STORE_VERSION:
+        return False
+    if not all(os.path.exists(store_part_path(csv_path, number)) for number in meta.get('parts', [])):
+        return False
+    # A registry that gained columns since the last build needs a rebuild too
+    return set(STORE_COLUMNS) <= set(meta.get('columns', []))
+
+
+def store_is_fresh(csv_path):
+    if not store_is_compatible(csv_path):
+        return False
+    meta = read_store_meta(csv_path)
+    fingerprint = source_fingerprint(csv_path)
+    return all(meta.get(key) == value for key, value in fingerprint.items())
+
+
+# Parse the source CSV with only the registered source columns and their compact dtypes
+def read_source_csv(csv_path):
+    header = pd.read_csv(csv_path, nrows=0).columns
+    usecols = [col for col in SOURCE_COLUMNS if col in header]
+
+    if pa_csv is not None:
+        df = read_csv_arrow(csv_path, usecols)
+    else:
+        dtypes = {col: COLUMN_REGISTRY[col] for col in usecols if col != 'date'}
+        df = pd.read_csv(csv_path, usecols=usecols, dtype=dtypes, parse_dates=['date'])
+
+    # Give every frame the same schema, whatever the source provides
+    for col in SOURCE_COLUMNS:
+        if col not in df.columns:
+            df[col] = pd.Series(np.nan, index=df.index).astype(COLUMN_REGISTRY[col])
+
+    return df[SOURCE_COLUMNS]
+
+
+# Parse the source CSV into the store's columns, computing the derived ones
+def read_owid_csv(csv_path):
+    return add_derived_columns(read_source_csv(csv_path))[STORE_COLUMNS]
+
+
+# Multi-threaded CSV parse with pyarrow, much faster than the pandas parser on the full file
+def read_csv_arrow(csv_path, usecols):
+    arrow_types = {
+        'category': pa.dictionary(pa.int32(), pa.string()),
+        'float32': pa.float32()
+    }
+    column_types = {col: arrow_types[COLUMN_REGISTRY[col]] for col in usecols if col != 'date'}
+    column_types['date'] = pa.timestamp('us')
+
+    table = pa_csv.read_csv(
+        csv_path,
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=usecols,
+            column_types=column_types,
+            strings_can_be_null=True
+        )
+    )
+    return table.to_pandas()
+
+
+# Estimate how much memory the full-width CSV would take if loaded without hints
+def estimate_full_frame_bytes(csv_path, rows):
+    sample = pd.read_csv(csv_path, nrows=MEMORY_SAMPLE_ROWS)
+    if sample.empty:
+        return 0
+    bytes_per_row = sample.memory_usage(deep=True, index=False).sum() / len(sample)
+    return int(bytes_per_row * rows)
+
+
+def add_death_rate(df):
+    death_rate = (df['total_deaths'] / df['total_cases'] * 100).round(2)
+    df['death_rate'] = death_rate.replace([np.inf, -np.inf], np.nan).fillna(0).astype('float32')
+    return df
+
+
+# Every column the store computes: the death rate and the derived metrics
+def add_derived_columns(df):
+    return add_derived_metrics(add_death_rate(df))
+
+
+# Write a Parquet file atomically, through a temporary file of this process
+def write_parquet(path, df):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    # Dictionary encoding only pays off for the categories; trying it on every float column
+    # more than doubles the write time for a larger file
+    df.to_parquet(tmp_path, index=False, use_dictionary=CATEGORY_COLUMNS)
+    os.replace(tmp_path, path)
+
+
+# Write the whole store as one file, dropping any appended parts
+def write_store(csv_path, df):
+    store_path, _ = store_paths(csv_path)
+    write_parquet(store_path, df)
+    base, _ = os.path.splitext(store_path)
+    for part_path in glob.glob(f'{base}.part*.parquet'):
+        os.remove(part_path)
+
+
+# The store's rows: the file written by the last build, then the parts appended since
+def read_store(csv_path, columns=None, meta=None):
+    store_path, _ = store_paths(csv_path)
+    meta = read_store_meta(csv_path) if meta is None else meta
+    paths = [store_path] + [store_part_path(csv_path, number) for number in meta.get('parts', [])]
+    frames = [pd.read_parquet(path, columns=columns) for path in paths]
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(unify_categories(frames), ignore_index=True)
+
+
+# Fingerprint of every location's source rows: the row count and the sum of the row hashes
+# (modulo 2**64), so a location keeps its fingerprint as long as its rows do, in whatever order
+# they come, and the fingerprint of appended rows adds to it
+def location_fingerprints(source):
+    codes, locations = pd.factorize(source['location'])
+    if len(locations) == 0:
+        return {}
+    hashes = pd.util.hash_pandas_object(source[SOURCE_COLUMNS], index=False).to_numpy()
+    reported = codes >= 0
+    codes, hashes = codes[reported], hashes[reported]
+
+    rows = np.bincount(codes, minlength=len(locations))
+    order = np.argsort(codes, kind='stable')
+    sums = np.add.reduceat(hashes[order], np.concatenate([[0], np.cumsum(rows)[:-1]]))
+    return {str(location): [int(count), int(total)] for location, count, total in zip(locations, rows, sums)}
+
+
+def add_fingerprints(fingerprints, added):
+    combined = dict(fingerprints)
+    for location, (rows, total) in added.items():
+        before_rows, before_total = combined.get(location, [0, 0])
+        combined[location] = [before_rows + rows, (before_total + total) % 2 ** 64]
+    return combined
+
+
+# Latest date of every location, as ISO dates
+def location_last_dates(df):
+    last = df.groupby('location', observed=True)['date'].max()
+    return {str(location): date.strftime('%Y-%m-%d') for location, date in last.items()}
+
+
+# One value per row of a per-location mapping, looked up once per location rather than per row
+def per_location(df, values, default):
+    locations = df['location'].cat.categories.astype(str)
+    lookup = np.array([values.get(location, default) for location in locations] + [default])
+    return lookup[df['location'].cat.codes.to_numpy()]
+
+
+# Convert the source CSV into the columnar store, replacing any previous store atomically.
+# Takes the parsed source when the caller has already read it.
+def build_store(csv_path, source=None):
+    fingerprint = source_fingerprint(csv_path)
+    source = read_source_csv(csv_path) if source is None else source
+    fingerprints = location_fingerprints(source)
+    df = add_derived_columns(source)[STORE_COLUMNS]
+    write_store(csv_path, df)
+
+    meta = dict(
+        fingerprint,
+        store_version=STORE_VERSION,
+        data_version=version_id(fingerprint),
+        previous_version=None,
+        changed_since=None,
+        changed_rows=len(df),
+        rows=len(df),
+        parts=[],
+        columns=list(df.columns),
+        source_column_count=len(pd.read_csv(csv_path, nrows=0).columns),
+        full_frame_bytes=estimate_full_frame_bytes(csv_path, len(df)),
+        store_frame_bytes=int(df.memory_usage(deep=True, index=False).sum()),
+        location_last_dates=location_last_dates(df),
+        location_fingerprints=fingerprints
+    )
+    write_store_meta(csv_path, meta)
+    return df
+
+
+# Give a categorical column the same categories in every frame so they concatenate cheaply
+def unify_categories(frames):
+    for col in CATEGORY_COLUMNS:
+        if col not in frames[0].columns:
+            continue
+        categories = pd.api.types.union_categoricals([frame[col] for frame in frames]).categories
+        for frame in frames:
+            frame[col] = frame[col].cat.set_categories(categories)
+    return frames
+
+
+# Apply a changed source CSV to the existing store by appending the rows dated after each
+# location's last ingested date. Only those rows and the LOOKBACK_DAYS before them are derived,
+# and they are written as a new part instead of rewriting the store. The rows already ingested
+# must be unchanged, which their fingerprints confirm; a revised or vanished location, or no
+# usable store, means a full rebuild.
+def refresh_store(csv_path):
+    if not store_is_compatible(csv_path):
+        return build_store(csv_path)
+
+    meta = read_store_meta(csv_path)
+    fingerprint = source_fingerprint(csv_path)
+    source = read_source_csv(csv_path)
+
+    last_dates = {location: np.datetime64(date) for location, date in meta['location_last_dates'].items()}
+    last = per_location(source, last_dates, np.datetime64('NaT', 'D'))
+    dates = source['date'].to_numpy()
+    new = np.isnat(last) | (dates > last)
+    if location_fingerprints(source[~new]) != meta['location_fingerprints']:
+        return build_store(csv_path, source)
+
+    meta.update(fingerprint)
+    if not new.any():
+        # Touched but identical, keep the current data version
+        write_store_meta(csv_path, meta)
+        return read_store(csv_path, STORE_COLUMNS, meta)
+
+    since = last + np.timedelta64(1, 'D')
+    needed = derivation_rows(source, since)
+    appended = add_derived_columns(source[needed].copy())[STORE_COLUMNS][new[needed]]
+    appended = appended.sort_values(KEY_COLUMNS, ignore_index=True)
+
+    parts = meta.get('parts', [])
+    if len(parts) >= MAX_STORE_PARTS:
+        # Compact the store with the new rows into one file again
+        stored = pd.concat(unify_categories([read_store(csv_path, STORE_COLUMNS, meta), appended]), ignore_index=True)
+        write_store(csv_path, stored.sort_values(KEY_COLUMNS, ignore_index=True))
+        parts = []
+    else:
+        parts = parts + [max(parts, default=0) + 1]
+        write_parquet(store_part_path(csv_path, parts[-1]), appended)
+
+    meta.update(
+        previous_version=meta['data_version'],
+        data_version=version_id(fingerprint),
+        changed_since=appended['date'].min().strftime('%Y-%m-%d'),
+        changed_rows=len(appended),
+        rows=meta['rows'] + len(appended),
+        parts=parts,
+        store_frame_bytes=meta['store_frame_bytes'] + int(appended.memory_usage(deep=True, index=False).sum()),
+        location_last_dates=dict(meta['location_last_dates'], **location_last_dates(appended)),
+        location_fingerprints=add_fingerprints(meta['location_fingerprints'], location_fingerprints(source[new]))
+    )
+    write_store_meta(csv_path, meta)
+    return read_store(csv_path, STORE_COLUMNS, meta)
+
+
+# Record which data version a frame holds and what changed since the previous one
+def tag_version(df, meta):
+    df.attrs['data_version'] = meta.get('data_version')
+    df.attrs['previous_version'] = meta.get('previous_version')
+    df.attrs['changed_since'] = meta.get('changed_since')
+    return df
+
+
+# Load the registered columns, applying source changes to the store only when the CSV has changed
+def load_store(csv_path, columns=None):
+    columns = STORE_COLUMNS if columns is None else columns
+    if not store_is_fresh(csv_path):
+        df = refresh_store(csv_path)[columns]
+    else:
+        df = read_store(csv_path, columns)
+    return tag_version(df, read_store_meta(csv_path))
+
+
+# The store as last built, without checking the source for changes; None when there is no usable store
+def read_current_store(csv_path, columns=None):
+    if not store_is_compatible(csv_path):
+        return None
+    columns = STORE_COLUMNS if columns is None else columns
+    meta = read_store_meta(csv_path)
+    return tag_version(read_store(csv_path, columns, meta), meta)
+
+
+# Summarise the memory saved by loading only the registered columns
+def memory_report(df, csv_path):
+    meta = read_store_meta(csv_path) or {}
+    loaded_bytes = int(df.memory_usage(deep=True, index=False).sum())
+    full_bytes = meta.get('full_frame_bytes')
+    if not full_bytes:
+        return None
+
+    return {
+        'loaded_columns': len(df.columns),
+        'source_columns': meta.get('source_column_count'),
+        'loaded_bytes': loaded_bytes,
+        'full_bytes': full_bytes,
+        'saved_bytes': full_bytes - loaded_bytes,
+        'reduction': full_bytes / loaded_bytes if loaded_bytes else None
+    }
@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+
+from covid19_hierarchy import WORLD
+
+# Days of new cases averaged before looking for peaks
+SMOOTHING_DAYS = 14
+
+# A peak is the highest point within this many days on either side
+WAVE_SEPARATION_DAYS = 60
+
+# Smallest peak counted as a wave, as a share of the location's highest peak
+MIN_PEAK_SHARE = 0.1
+
+# Waves that peaked this close to the latest date are reported as recent
+RECENT_WAVE_DAYS = 90
+
+
+# Rows of a (location x date) table kept as their trailing mean over `width` columns, from
+# running sums; columns with no reports are skipped rather than counted as zero
+def trailing_mean(table, width):
+    present = ~np.isnan(table)
+    zeros = np.zeros((len(table), 1))
+    sums = np.hstack([zeros, np.cumsum(np.where(present, table, 0.0), axis=1)])
+    counts = np.hstack([zeros, np.cumsum(present, axis=1)])
+    stops = np.arange(1, table.shape[1] + 1)
+    starts = np.maximum(stops - width, 0)
+    count = counts[:, stops] - counts[:, starts]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, (sums[:, stops] - sums[:, starts]) / count, np.nan)
+
+
+# Maximum over the next `width` columns of every column, for all rows at once (van Herk /
+# Gil-Werman): running maxima within blocks of `width` columns from both ends, so the cost
+# does not grow with the width
+def forward_window_max(table, width):
+    rows, cols = table.shape
+    blocks = -(-cols // width) + 1
+    padded = np.full((rows, blocks * width), -np.inf)
+    padded[:, :cols] = table
+    padded = padded.reshape(rows, blocks, width)
+    prefix = np.maximum.accumulate(padded, axis=2).reshape(rows, -1)
+    suffix = np.maximum.accumulate(padded[:, :, ::-1], axis=2)[:, :, ::-1].reshape(rows, -1)
+    return np.maximum(suffix[:, :cols], prefix[:, width - 1:width - 1 + cols])
+
+
+# Peaks of every row: strictly above the previous `width` columns, at least as high as the next
+# `width` columns, and at least MIN_PEAK_SHARE of the row's highest value
+def find_peaks(smoothed, width):
+    values = np.where(np.isnan(smoothed), -np.inf, smoothed)
+    edge = np.full((len(values), width), -np.inf)
+    window_max = forward_window_max(np.hstack([edge, values, edge, edge[:, :1]]), width)
+    cols = values.shape[1]
+    before = window_max[:, :cols]
+    after = window_max[:, width + 1:width + 1 + cols]
+    highest = values.max(axis=1, initial=-np.inf)[:, None]
+    return (values > before) & (values >= after) & (values > 0) & (values >= MIN_PEAK_SHARE * highest)
+
+
+# Waves of every country and of every level of the hierarchy, found in one batch over a
+# (location x date) table of smoothed new cases. Returns a table of waves (one row per peak,
+# numbered per location), a table of wave counts and intensity per country, and the latest date.
+# Built once per data version, like the hierarchy it takes the continent and world series from.
+def build_waves(df, hierarchy):
+    countries = sorted(hierarchy['parents'])
+    levels = list(hierarchy['series'])
+    rows = df[df['location'].isin(countries)]
+
+    dates = hierarchy['series'][WORLD].index.to_numpy()
+    table = np.full((len(countries) + len(levels), len(dates)), np.nan)
+    table[
+        pd.Index(countries).get_indexer(rows['location'].astype(str)),
+        np.searchsorted(dates, rows['date'].to_numpy())
+    ] = rows['new_cases'].to_numpy(dtype='float64')
+    for i, level in enumerate(levels, start=len(countries)):
+        if 'new_cases' in hierarchy['series'][level].columns:
+            table[i] = hierarchy['series'][level]['new_cases'].to_numpy()
+
+    # Windows in days, converted to columns for datasets reported weekly or monthly, and
+    # smoothed values as new cases a day whatever the reporting period
+    step = max(np.median(np.diff(dates)) / np.timedelta64(1, 'D'), 1) if len(dates) > 1 else 1
+    smoothed = trailing_mean(table, max(1, round(SMOOTHING_DAYS / step))) / step
+    location, column = np.nonzero(find_peaks(smoothed, max(1, round(WAVE_SEPARATION_DAYS / step))))
+
+    # Population per country, and the sum of their populations per level
+    names = np.array(countries + levels, dtype=object)
+    population = np.full(len(names), np.nan)
+    if 'population' in rows.columns:
+        latest = rows.drop_duplicates('location', keep='last')
+        country_population = pd.Series(latest['population'].to_numpy(dtype='float64'), index=latest['location'].astype(str))
+        population[:len(countries)] = country_population.reindex(countries).to_numpy()
+        parents = pd.Series(hierarchy['parents'])
+        for i, level in enumerate(levels, start=len(countries)):
+            members = country_population.reindex(countries if level == WORLD else parents.index[parents == level])
+            population[i] = members.sum(min_count=1)
+
+    first = np.searchsorted(location, np.arange(len(names)))
+    peak = smoothed[location, column]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        per_million = peak / population[location] * 1e6
+    waves = pd.DataFrame({
+        'location': names[location],
+        'wave': np.arange(len(location)) - first[location] + 1,
+        'peak_date': dates[column],
+        'peak_new_cases': peak,
+        'peak_per_million': per_million
+    })
+
+    country_waves = waves[waves['location'].isin(countries)]
+    largest = country_waves.loc[country_waves.groupby('location', sort=True)['peak_new_cases'].idxmax()]
+    summary = pd.DataFrame({
+        'continent': pd.Series(hierarchy['parents']).reindex(largest['location']).to_numpy(),
+        'waves': country_waves.groupby('location', sort=True)['wave'].max().to_numpy(),
+        'largest_peak_date': largest['peak_date'].to_numpy(),
+        'largest_peak_new_cases': largest['peak_new_cases'].to_numpy(),
+        'largest_peak_per_million': largest['peak_per_million'].to_numpy(),
+        'latest_peak_date': country_waves.groupby('location', sort=True)['peak_date'].max().to_numpy()
+    }, index=pd.Index(largest['location'].to_numpy(), name='location'))
+
+    return {
+        'waves': waves,
+        'countries': summary,
+        'latest_date': pd.Timestamp(dates[-1]) if len(dates) else None
+    }
+
+
+# Waves of one level (WORLD or a continent)
+def level_waves(waves, level=WORLD):
+    return waves['waves'][waves['waves']['location'] == level]
+
+
+# Countries whose latest wave peaked within RECENT_WAVE_DAYS of the latest date
+def recent_waves(waves, countries=None, days=RECENT_WAVE_DAYS):
+    summary = waves['countries'] if countries is None else waves['countries'].reindex(countries).dropna(subset=['waves'])
+    if waves['latest_date'] is None:
+        return summary.iloc[:0]
+    return summary[summary['latest_peak_date'] >= waves['latest_date'] - pd.Timedelta(days=days)]
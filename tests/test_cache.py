@@ -0,0 +1,49 @@
+import pandas as pd
+import plotly.graph_objects as go
+import pytest
+
+from covid19_cache import LRUCache, figure_size
+from covid19_pipeline import DashboardPipeline, create_sample_data, discard_other_versions
+
+
+def sample_frame(version):
+    df = create_sample_data(seed=0)
+    df.attrs['data_version'] = version
+    return df
+
+
+def test_views_of_other_versions_are_discarded():
+    views = LRUCache()
+    old, new = sample_frame('v1'), sample_frame('v2')
+    for df in [old, new]:
+        DashboardPipeline(df, '2021-01-01', '2021-12-31', ['Brazil'], views=views).filtered
+
+    discard_other_versions([views], 'v2')
+
+    assert [key[1] for key in views.entries] == ['v2']
+    assert views.total_bytes == sum(size for _, size in views.entries.values())
+
+
+def test_country_order_does_not_change_the_cached_rows():
+    views = LRUCache()
+    df = sample_frame('v1')
+    first = DashboardPipeline(df, '2021-01-01', '2021-12-31', ['India', 'Brazil'], views=views).filtered
+    second = DashboardPipeline(df, '2021-01-01', '2021-12-31', ['Brazil', 'India'], views=views).filtered
+    uncached = DashboardPipeline(df, '2021-01-01', '2021-12-31', ['Brazil', 'India']).filtered
+
+    assert second is first
+    pd.testing.assert_frame_equal(first, uncached)
+
+
+def test_figure_size_does_not_serialise_the_figure(monkeypatch):
+    df = sample_frame('v1')
+    figures = LRUCache(sizeof=figure_size)
+    pipeline = DashboardPipeline(df, '2020-01-01', '2022-12-31', list(df['location'].unique()), figures=figures)
+    metrics = [('total_cases', 'Total Cases'), ('new_cases', 'New Cases')]
+    monkeypatch.setattr(go.Figure, 'to_json', lambda self, *args, **kwargs: pytest.fail('figure serialised'))
+
+    small = figure_size(pipeline.time_series_figure(metrics[:1]))
+    large = figure_size(pipeline.time_series_figure(metrics))
+
+    assert large > small > len(df) * 8
+    assert figures.total_bytes == small + large
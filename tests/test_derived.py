@@ -0,0 +1,21 @@
+import numpy as np
+
+from covid19_pipeline import create_sample_data
+
+
+def test_monthly_reports_give_daily_averages_and_growth():
+    df = create_sample_data(seed=0)
+    series = df[df['location'] == 'United States']
+    days = series['date'].diff().dt.days.to_numpy()[1:]
+
+    np.testing.assert_allclose(series['new_cases_avg_7'].to_numpy()[1:], series['new_cases'].to_numpy()[1:] / days, rtol=1e-5)
+    assert series['case_growth_rate'].iloc[1:].notna().all()
+    assert series['case_doubling_days'].notna().any()
+
+
+def test_daily_reports_are_averaged_over_the_window():
+    df = create_sample_data(freq='daily', start='2021-01-01', end='2021-03-01', seed=0)
+    series = df[df['location'] == 'India']
+
+    expected = series['new_cases'].rolling(7, min_periods=1).mean().to_numpy()
+    np.testing.assert_allclose(series['new_cases_avg_7'].to_numpy(), expected, rtol=1e-5)
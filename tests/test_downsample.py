@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from covid19_downsample import downsample_frame, lttb_indices, minmax_indices
+
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(0)
+    x = np.arange(5000, dtype=np.float64)
+    y = np.sin(x / 300) * 100 + rng.normal(0, 5, len(x))
+    y[1234], y[3210] = 1000.0, -1000.0
+    return x, y
+
+
+@pytest.mark.parametrize('pick', [lttb_indices, minmax_indices])
+@pytest.mark.parametrize('threshold', [10, 101, 1000])
+def test_keeps_end_points_in_order(series, pick, threshold):
+    x, y = series
+    selected = pick(x, y, threshold)
+
+    assert selected[0] == 0 and selected[-1] == len(x) - 1
+    assert (np.diff(selected) > 0).all()
+    assert len(selected) <= threshold
+
+
+@pytest.mark.parametrize('pick', [lttb_indices, minmax_indices])
+def test_short_series_are_kept_whole(series, pick):
+    x, y = series
+    assert (pick(x[:50], y[:50], 100) == np.arange(50)).all()
+
+
+@pytest.mark.parametrize('threshold', [10, 1000])
+def test_lttb_keeps_the_threshold_and_the_spikes(series, threshold):
+    x, y = series
+    selected = lttb_indices(x, y, threshold)
+
+    assert len(selected) == threshold
+    assert {1234, 3210} <= set(selected)
+
+
+@pytest.mark.parametrize('threshold', [10, 101, 1000])
+def test_minmax_keeps_every_bucket_extreme(series, threshold):
+    x, y = series
+    selected = minmax_indices(x, y, threshold)
+
+    buckets = (threshold - 2) // 2
+    size = -(-len(y) // buckets)
+    for start in range(0, len(y), size):
+        bucket = y[start:start + size]
+        assert start + bucket.argmin() in selected
+        assert start + bucket.argmax() in selected
+
+
+def test_downsample_frame_keeps_each_series_peak():
+    dates = pd.date_range('2020-01-01', periods=3000)
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame({
+        'date': np.tile(dates, 2),
+        'location': np.repeat(['A', 'B'], len(dates)),
+        'new_cases': rng.random(2 * len(dates))
+    })
+    data.loc[[100, 4500], 'new_cases'] = [5.0, 7.0]
+
+    reduced = downsample_frame(data, 'date', 'new_cases', series_points=200)
+
+    assert reduced.groupby('location')['new_cases'].max().to_dict() == {'A': 5.0, 'B': 7.0}
+    assert reduced.groupby('location').size().max() <= 200
+    assert reduced.index.is_monotonic_increasing
@@ -0,0 +1,142 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from covid19_fetch import fetch_dataset, fetch_paths, read_fetch_state, write_fetch_state
+
+BODY = bytes(range(256)) * 256
+
+
+# Local stand-in for the dataset server: serves one file with a strong ETag and honours
+# If-None-Match, Range and If-Range. Every request's headers are recorded.
+class DatasetServer(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), DatasetHandler)
+        self.body = BODY
+        self.etag = '"v1"'
+        self.truncate_at = None
+        self.requests = []
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/owid-covid-data.csv'
+
+
+class DatasetHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        body = server.body
+
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.send_header('ETag', server.etag)
+            self.end_headers()
+            return
+
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range', server.etag) == server.etag:
+            start = int(range_header[len('bytes='):].split('-')[0])
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(body)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(body) - 1}/{len(body)}')
+        else:
+            self.send_response(200)
+
+        content = body[start:]
+        self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+
+        # Drop the connection part-way through, once, to interrupt the download
+        if server.truncate_at is not None:
+            content, server.truncate_at = content[:server.truncate_at], None
+            self.wfile.write(content)
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = DatasetServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def file_path(tmp_path):
+    return str(tmp_path / 'owid-covid-data.csv')
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_unchanged_dataset_is_revalidated_with_304(server, file_path):
+    assert fetch_dataset(server.url, file_path)
+    assert not fetch_dataset(server.url, file_path)
+
+    assert server.requests[-1]['If-None-Match'] == '"v1"'
+    assert read_bytes(file_path) == BODY
+    assert read_fetch_state(file_path)['etag'] == '"v1"'
+
+
+def test_interrupted_download_is_resumed_with_206(server, file_path):
+    part_path, _ = fetch_paths(file_path)
+    server.truncate_at = 20000
+    with pytest.raises(requests.exceptions.RequestException):
+        fetch_dataset(server.url, file_path, chunk_size=1024)
+    assert not os.path.exists(file_path)
+    offset = os.path.getsize(part_path)
+    assert 0 < offset < len(BODY)
+
+    assert fetch_dataset(server.url, file_path, chunk_size=1024)
+    assert server.requests[-1]['Range'] == f'bytes={offset}-'
+    assert server.requests[-1]['If-Range'] == '"v1"'
+    assert read_bytes(file_path) == BODY
+    assert not os.path.exists(part_path)
+
+
+def test_partial_download_of_a_changed_file_is_replaced_by_200(server, file_path):
+    part_path, _ = fetch_paths(file_path)
+    with open(part_path, 'wb') as f:
+        f.write(BODY[:1000])
+    write_fetch_state(file_path, {'url': server.url, 'partial': {'etag': '"v1"', 'last_modified': None}})
+    server.body, server.etag = BODY[::-1], '"v2"'
+
+    assert fetch_dataset(server.url, file_path)
+    assert server.requests[-1]['If-Range'] == '"v1"'
+    assert len(server.requests) == 1
+    assert read_bytes(file_path) == BODY[::-1]
+    assert read_fetch_state(file_path)['etag'] == '"v2"'
+
+
+def test_unsatisfiable_range_restarts_the_download(server, file_path):
+    part_path, _ = fetch_paths(file_path)
+    with open(part_path, 'wb') as f:
+        f.write(BODY + b'stale tail')
+    write_fetch_state(file_path, {'url': server.url, 'partial': {'etag': '"v1"', 'last_modified': None}})
+
+    assert fetch_dataset(server.url, file_path)
+    assert [request.get('Range') for request in server.requests] == [f'bytes={len(BODY) + 10}-', None]
+    assert read_bytes(file_path) == BODY
+    assert 'partial' not in read_fetch_state(file_path)
+    assert not os.path.exists(part_path)
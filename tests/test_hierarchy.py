@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+from covid19_hierarchy import WORLD, build_hierarchy, country_mask, hierarchy_totals, level_members
+
+# location, iso_code, continent, new_cases
+ROWS = [
+    ('France', 'FRA', 'Europe', 10.0),
+    ('United Kingdom', 'GBR', 'Europe', 20.0),
+    ('Kosovo', 'OWID_KOS', 'Europe', 1.0),
+    ('Northern Cyprus', 'OWID_CYN', 'Asia', 2.0),
+    ('Japan', 'JPN', 'Asia', 30.0),
+    # Parts of the United Kingdom, reported with a continent
+    ('England', 'OWID_ENG', 'Europe', 15.0),
+    ('Scotland', 'OWID_SCT', 'Europe', 2.0),
+    ('Wales', 'OWID_WLS', 'Europe', 2.0),
+    ('Northern Ireland', 'OWID_NIR', 'Europe', 1.0),
+    # Sub-national regions with ISO 3166-2 codes
+    ('Tokyo', 'JP-13', 'Asia', 12.0),
+    # Aggregates
+    ('World', 'OWID_WRL', None, 63.0),
+    ('Europe', 'OWID_EUR', None, 31.0),
+    ('Asia', 'OWID_ASI', None, 32.0),
+    ('High income', 'OWID_HIC', None, 60.0),
+    ('European Union (27)', 'OWID_EU27', None, 10.0),
+    ('International', 'OWID_INT', None, 0.0),
+]
+
+COUNTRIES = ['France', 'Japan', 'Kosovo', 'Northern Cyprus', 'United Kingdom']
+
+
+@pytest.fixture
+def frame():
+    df = pd.DataFrame(ROWS, columns=['location', 'iso_code', 'continent', 'new_cases'])
+    df['date'] = pd.Timestamp('2021-01-01')
+    return df
+
+
+def test_country_mask_keeps_only_countries(frame):
+    assert sorted(frame.loc[country_mask(frame), 'location']) == COUNTRIES
+
+
+def test_country_mask_without_continents(frame):
+    frame = frame.drop(columns='continent')
+    assert sorted(frame.loc[country_mask(frame), 'location']) == COUNTRIES
+
+
+def test_totals_count_every_country_once(frame):
+    hierarchy = build_hierarchy(frame)
+
+    assert level_members(hierarchy) == COUNTRIES
+    assert level_members(hierarchy, ['Europe']) == ['France', 'Kosovo', 'United Kingdom']
+    assert hierarchy_totals(hierarchy, WORLD)['new_cases'] == 63.0
+    assert hierarchy_totals(hierarchy, 'Europe')['new_cases'] == 31.0
+    assert hierarchy_totals(hierarchy, 'Asia')['new_cases'] == 32.0
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from covid19_index import build_series_index, build_snapshot, latest_metric, select_rows, update_snapshot
+from covid19_pipeline import create_sample_data
+from covid19_store import METRIC_COLUMNS
+
+
+@pytest.fixture(scope='module')
+def df():
+    return create_sample_data(freq='daily', start='2020-01-01', end='2021-06-30', seed=0)
+
+
+# The sort + groupby that build_snapshot and latest_metric replaced: the latest row of each
+# location among the rows reporting the column
+def latest_rows(df, column, start=None):
+    rows = df.dropna(subset=[column])
+    if start is not None:
+        rows = rows[rows['date'] >= start]
+    latest = rows.sort_values('date', kind='stable').groupby('location', observed=True).tail(1)
+    return latest.assign(location=latest['location'].astype(str)).set_index('location').sort_index()
+
+
+def test_snapshot_matches_sort_groupby(df):
+    snapshot = build_snapshot(df.sample(frac=1, random_state=0))
+
+    assert snapshot['values']['date'].to_dict() == df.groupby('location', observed=True)['date'].max().to_dict()
+    for column in METRIC_COLUMNS:
+        expected = latest_rows(df, column)
+        values = snapshot['values'][column].dropna()
+        pd.testing.assert_series_equal(values, expected[column], check_names=False, check_index_type=False)
+        pd.testing.assert_series_equal(snapshot['dates'][column].dropna(), expected['date'], check_names=False,
+                                       check_index_type=False)
+
+
+@pytest.mark.parametrize('locations', [None, ['India', 'Brazil']])
+@pytest.mark.parametrize('start', [None, pd.Timestamp('2021-05-01')])
+def test_latest_metric_matches_sort_groupby(df, locations, start):
+    column = 'people_vaccinated_per_hundred'
+    latest = latest_metric(build_snapshot(df), column, locations, start).set_index('location')
+
+    expected = latest_rows(df if not locations else df[df['location'].isin(locations)], column, start)
+    expected = expected[['iso_code', column, 'date']].astype({'iso_code': object})
+    assert len(expected)
+    pd.testing.assert_frame_equal(latest[expected.columns], expected, check_index_type=False, check_dtype=False)
+
+
+def test_updated_snapshot_matches_a_new_one(df):
+    since = pd.Timestamp('2021-06-20')
+    previous = build_snapshot(df[df['date'] < since])
+
+    updated = update_snapshot(previous, df, since)
+
+    expected = build_snapshot(df)
+    pd.testing.assert_frame_equal(updated['values'], expected['values'])
+    pd.testing.assert_frame_equal(updated['dates'], expected['dates'])
+
+
+# The boolean-mask filter select_rows replaced
+def mask_filter(df, locations, start, end):
+    mask = (df['date'] >= start) & (df['date'] <= end)
+    if locations:
+        mask &= df['location'].isin(locations)
+    return df[mask].sort_values(['location', 'date'], ignore_index=True)
+
+
+@pytest.mark.parametrize('locations', [None, [], ['India'], ['India', 'Brazil', 'Nowhere'], ['Brazil', 'Canada', 'China']])
+@pytest.mark.parametrize('start, end', [
+    ('2020-01-01', '2021-06-30'),
+    ('2021-02-10', '2021-03-05'),
+    ('2019-01-01', '2019-12-31'),
+    ('2020-12-20', '2021-01-10'),
+    ('2021-06-30', '2021-06-30')
+])
+def test_select_rows_matches_the_mask_filter(df, locations, start, end):
+    index = build_series_index(df)
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+
+    rows = select_rows(index, locations, start, end)
+
+    expected = mask_filter(df, locations, start, end)
+    pd.testing.assert_frame_equal(rows.sort_values(['location', 'date'], ignore_index=True), expected)
+
+
+def test_neighbouring_locations_are_a_view(df):
+    index = build_series_index(df)
+    locations = sorted(index['bounds'])[:3]
+
+    rows = select_rows(index, locations)
+
+    assert len(rows) == sum(hi - lo for lo, hi in (index['bounds'][loc] for loc in locations))
+    assert np.shares_memory(rows['total_cases'].to_numpy(), index['frame']['total_cases'].to_numpy())
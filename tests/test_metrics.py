@@ -0,0 +1,30 @@
+from covid19_cache import LRUCache
+from covid19_metrics import StageMetrics, StageRecorder, prometheus_text
+from covid19_pipeline import DashboardPipeline, create_sample_data
+
+METRICS = [('total_cases', 'Total Cases'), ('new_cases', 'New Cases'), ('total_deaths', 'Total Deaths')]
+
+
+def test_stage_names_do_not_depend_on_the_selection():
+    df = create_sample_data(seed=0)
+    df.attrs['data_version'] = 'v1'
+    views, figures = LRUCache(), LRUCache()
+    metrics = StageMetrics()
+
+    for count in range(1, len(METRICS) + 1):
+        for page in range(2):
+            recorder = StageRecorder(enabled=True)
+            pipeline = DashboardPipeline(df, '2020-01-01', '2022-12-31', ['Brazil', 'India'], views=views,
+                                         figures=figures, recorder=recorder)
+            pipeline.time_series_figure(METRICS[:count])
+            pipeline.comparison_figure(METRICS[:count], page)
+            pipeline.vaccination_bar_figure(page, ascending=bool(page))
+            pipeline.map_figure(METRICS[count - 1][0], METRICS[count - 1][1])
+            metrics.record(recorder.finish())
+
+    stages = metrics.snapshot()
+    assert {'figure:line_grid', 'figure:bar_grid', 'figure:vaccination_bar', 'figure:choropleth',
+            'metric_series', 'vaccination_ranking', 'downsample'} <= set(stages)
+    assert stages['figure:line_grid']['calls'] == len(METRICS)
+    assert not any(col in name for name in stages for col, _ in METRICS)
+    assert 'total_cases' not in prometheus_text(stages)
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from covid19_ranking import rank_order, rank_page, rank_positions
+
+
+def stable_ranking(values, ascending):
+    valid = np.flatnonzero(~np.isnan(values))
+    keys = values[valid] if ascending else -values[valid]
+    return valid[np.argsort(keys, kind='stable')]
+
+
+@pytest.mark.parametrize('ascending', [False, True])
+@pytest.mark.parametrize('seed', range(50))
+def test_pages_join_into_one_stable_sort(seed, ascending):
+    rng = np.random.default_rng(seed)
+    values = rng.integers(0, 8, 137).astype('float64')
+    values[rng.random(137) < 0.1] = np.nan
+    frame = pd.DataFrame({'value': values, 'row': np.arange(137)})
+
+    first = rank_page(frame, 'value', 0, 10, ascending)
+    pages = [rank_page(frame, 'value', page, 10, ascending) for page in range(first['pages'])]
+    joined = np.concatenate([page['frame']['row'].to_numpy() for page in pages])
+
+    np.testing.assert_array_equal(joined, stable_ranking(values, ascending))
+    assert [page['first_rank'] for page in pages] == list(range(1, len(joined) + 1, 10))
+
+
+def test_rank_positions_breaks_ties_by_position():
+    values = np.array([3.0, 5.0, 5.0, np.nan, 5.0, 1.0])
+
+    assert rank_positions(values, 2).tolist() == [1, 2]
+    assert rank_positions(values, 2, offset=2).tolist() == [4, 0]
+    assert rank_order(values, ascending=True).tolist() == [5, 0, 1, 2, 4, 3]
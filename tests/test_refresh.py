@@ -0,0 +1,55 @@
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+import covid19_refresh
+from covid19_pipeline import create_sample_data
+from covid19_refresh import DatasetRefresher, host_lock
+from covid19_store import DERIVED_COLUMNS, build_store
+
+
+def take_lock(file_path, acquired):
+    with host_lock(file_path):
+        acquired.value = time.time()
+
+
+@pytest.mark.skipif(covid19_refresh.fcntl is None, reason="no fcntl on this platform")
+def test_host_lock_excludes_other_processes(tmp_path):
+    file_path = str(tmp_path / 'owid-covid-data.csv')
+    context = multiprocessing.get_context('fork')
+    acquired = context.Value('d', 0.0)
+
+    with host_lock(file_path):
+        child = context.Process(target=take_lock, args=(file_path, acquired))
+        child.start()
+        time.sleep(0.5)
+        released = time.time()
+    child.join(10)
+
+    assert child.exitcode == 0
+    assert acquired.value >= released
+
+
+def test_start_leaves_reading_the_store_to_the_worker(tmp_path, monkeypatch):
+    file_path = str(tmp_path / 'owid-covid-data.csv')
+    create_sample_data(seed=0).drop(columns=DERIVED_COLUMNS).to_csv(file_path, index=False)
+    build_store(file_path)
+
+    readers = []
+    read_current_store = covid19_refresh.read_current_store
+    monkeypatch.setattr(covid19_refresh, 'read_current_store', lambda path: readers.append(threading.current_thread()) or read_current_store(path))
+    monkeypatch.setattr(DatasetRefresher, 'refresh', lambda self: None)
+
+    warmed = threading.Event()
+    refresher = DatasetRefresher('http://127.0.0.1:9/', file_path, on_refresh=lambda df: warmed.set()).start()
+    assert warmed.wait(30)
+    deadline = time.time() + 10
+    while refresher.current() is None and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert readers and threading.current_thread() not in readers
+    assert refresher.current() is not None
+    assert os.path.exists(file_path + '.lock')
@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+
+from covid19_pipeline import create_sample_data
+from covid19_rollup import build_rollup, update_rollup
+from covid19_store import add_death_rate
+
+PERIODS = {'weekly': 'W-SUN', 'monthly': 'M'}
+
+
+@pytest.fixture(scope='module')
+def df():
+    return create_sample_data(locations=5, freq='daily', start='2020-11-01', end='2021-06-30', seed=0)
+
+
+# The rollup written as a plain groupby over calendar periods
+def expected_rollup(df, resolution):
+    groups = df.groupby([df['location'].astype(str), df['date'].dt.to_period(PERIODS[resolution])])
+    expected = pd.DataFrame({
+        'date': groups['date'].max(),
+        'new_cases': groups['new_cases'].sum(),
+        'new_deaths': groups['new_deaths'].sum(),
+        'total_cases': groups['total_cases'].last(),
+        'total_deaths': groups['total_deaths'].last(),
+        'people_vaccinated_per_hundred': groups['people_vaccinated_per_hundred'].last()
+    })
+    return add_death_rate(expected.droplevel(1).rename_axis('location').reset_index())
+
+
+def comparable(frame, columns):
+    frame = frame.assign(location=frame['location'].astype(str))[columns]
+    return frame.sort_values(['location', 'date'], ignore_index=True)
+
+
+@pytest.mark.parametrize('resolution', ['weekly', 'monthly'])
+def test_rollup_sums_new_and_keeps_the_last_cumulative_values(df, resolution):
+    expected = expected_rollup(df, resolution)
+    rollup = comparable(build_rollup(df, resolution)['frame'], expected.columns)
+
+    assert len(rollup) == len(expected)
+    pd.testing.assert_frame_equal(rollup, comparable(expected, expected.columns), check_dtype=False, rtol=1e-5)
+
+
+@pytest.mark.parametrize('resolution', ['weekly', 'monthly'])
+def test_every_row_is_dated_by_the_last_reported_day(df, resolution):
+    reported = df[df['date'].dt.dayofweek != 6]
+    rollup = build_rollup(reported, resolution)['frame']
+
+    assert rollup['date'].isin(reported['date']).all()
+    pd.testing.assert_frame_equal(comparable(rollup, ['location', 'date']),
+                                  comparable(expected_rollup(reported, resolution), ['location', 'date']))
+
+
+@pytest.mark.parametrize('resolution', ['weekly', 'monthly'])
+def test_updated_rollup_matches_a_new_one(df, resolution):
+    since = pd.Timestamp('2021-06-16')
+    previous = build_rollup(df[df['date'] < since], resolution)
+
+    updated = update_rollup(previous, df, since, resolution)['frame']
+
+    expected = build_rollup(df, resolution)['frame']
+    pd.testing.assert_frame_equal(comparable(updated, expected.columns), comparable(expected, expected.columns))
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from covid19_pipeline import create_sample_data
+from covid19_shared import freeze_frame, publish_shared, session_frame
+
+
+def column_buffer(df, col):
+    values = df[col].array
+    return values.codes if isinstance(values, pd.Categorical) else np.asarray(values)
+
+
+@pytest.fixture(params=['mapped', 'frozen'])
+def shared(request, tmp_path):
+    df = create_sample_data(seed=0)
+    df.attrs['data_version'] = 'v1'
+    if request.param == 'frozen':
+        return freeze_frame(df)
+    return publish_shared(df, str(tmp_path / 'owid-covid-data.csv'))
+
+
+def test_every_rerun_gets_the_same_buffers(shared):
+    first, second = session_frame(shared), session_frame(shared)
+
+    assert first.attrs['data_version'] == 'v1'
+    for col in shared.columns:
+        assert np.shares_memory(column_buffer(first, col), column_buffer(shared, col))
+        assert np.shares_memory(column_buffer(second, col), column_buffer(shared, col))
+        assert not column_buffer(shared, col).flags.writeable
+
+
+def test_a_rerun_cannot_change_what_other_reruns_see(shared):
+    first, second = session_frame(shared), session_frame(shared)
+    total_cases = shared['total_cases'].iloc[0]
+
+    first['extra'] = 1.0
+    first['new_cases'] = 0.0
+    try:
+        first.iloc[0, first.columns.get_loc('total_cases')] = -1.0
+    except ValueError:
+        pass
+
+    assert 'extra' not in second.columns and 'extra' not in shared.columns
+    assert (second['new_cases'] == shared['new_cases']).all()
+    assert second['total_cases'].iloc[0] == shared['total_cases'].iloc[0] == total_cases
@@ -0,0 +1,8 @@
+from covid19_benchmark import startup_report
+
+
+def test_entry_point_imports_within_budget():
+    report = startup_report()
+
+    assert report['deferred_imported'] == []
+    assert not report['over_budget'], f"imports took {report['import_s']:.2f}s: {report['slowest'][:3]}"
@@ -0,0 +1,102 @@
+import os
+
+import pandas as pd
+import pytest
+
+import covid19_store
+from covid19_pipeline import create_sample_data
+from covid19_store import DERIVED_COLUMNS, build_store, load_store, read_store_meta
+
+
+@pytest.fixture
+def source():
+    return create_sample_data(freq='daily', start='2021-01-01', end='2021-03-31', seed=0).drop(columns=DERIVED_COLUMNS)
+
+
+def write_csv(path, frame):
+    frame.to_csv(path, index=False)
+    # Make sure the store sees a new file even within the timestamp resolution
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1000))
+
+
+def comparable(df):
+    df = df.assign(**{col: df[col].astype(str) for col in ['location', 'iso_code', 'continent']})
+    return df.sort_values(['location', 'date'], ignore_index=True)
+
+
+def full_build(tmp_path, frame):
+    path = str(tmp_path / 'full' / 'owid-covid-data.csv')
+    os.makedirs(os.path.dirname(path))
+    frame.to_csv(path, index=False)
+    return build_store(path)
+
+
+def test_incremental_refresh_matches_a_full_build(tmp_path, source):
+    path = str(tmp_path / 'owid-covid-data.csv')
+    dates = sorted(source['date'].unique())
+    write_csv(path, source[source['date'] < dates[-5]])
+    load_store(path)
+
+    for cut in [dates[-3], dates[-1], None]:
+        write_csv(path, source if cut is None else source[source['date'] < cut])
+        df = load_store(path)
+
+    meta = read_store_meta(path)
+    assert meta['parts'] == [1, 2, 3]
+    assert meta['changed_rows'] == source['location'].nunique()
+    assert df.attrs['changed_since'] == pd.Timestamp(dates[-1]).strftime('%Y-%m-%d')
+    pd.testing.assert_frame_equal(comparable(df), comparable(full_build(tmp_path, source)))
+
+
+def test_new_location_is_appended_whole(tmp_path, source):
+    path = str(tmp_path / 'owid-covid-data.csv')
+    write_csv(path, source[source['location'] != 'India'])
+    load_store(path)
+
+    write_csv(path, source)
+    df = load_store(path)
+
+    assert read_store_meta(path)['parts'] == [1]
+    pd.testing.assert_frame_equal(comparable(df), comparable(full_build(tmp_path, source)))
+
+
+def test_revised_history_rebuilds_the_store(tmp_path, source):
+    path = str(tmp_path / 'owid-covid-data.csv')
+    dates = sorted(source['date'].unique())
+    write_csv(path, source[source['date'] < dates[-1]])
+    first = load_store(path)
+
+    revised = source.copy()
+    revised.loc[revised['date'] == dates[0], 'new_cases'] += 1
+    write_csv(path, revised)
+    df = load_store(path)
+
+    meta = read_store_meta(path)
+    assert meta['parts'] == [] and meta['previous_version'] is None
+    assert df.attrs['data_version'] != first.attrs['data_version']
+    pd.testing.assert_frame_equal(comparable(df), comparable(full_build(tmp_path, revised)))
+
+
+def test_unchanged_source_keeps_the_data_version(tmp_path, source):
+    path = str(tmp_path / 'owid-covid-data.csv')
+    write_csv(path, source)
+    first = load_store(path)
+
+    write_csv(path, source)
+    df = load_store(path)
+
+    assert df.attrs['data_version'] == first.attrs['data_version']
+    assert read_store_meta(path)['parts'] == []
+
+
+def test_parts_are_compacted(tmp_path, source, monkeypatch):
+    monkeypatch.setattr(covid19_store, 'MAX_STORE_PARTS', 1)
+    path = str(tmp_path / 'owid-covid-data.csv')
+    dates = sorted(source['date'].unique())
+    for cut in [dates[-3], dates[-2], dates[-1], None]:
+        write_csv(path, source if cut is None else source[source['date'] < cut])
+        df = load_store(path)
+
+    assert read_store_meta(path)['parts'] == [1]
+    assert not os.path.exists(str(tmp_path / 'owid-covid-data.part2.parquet'))
+    pd.testing.assert_frame_equal(comparable(df), comparable(full_build(tmp_path, source)))
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from covid19_hierarchy import WORLD, build_hierarchy
+from covid19_waves import build_waves, level_waves, recent_waves
+
+DATES = pd.date_range('2020-01-01', periods=700)
+
+# Peaks of new cases per country as (day, height); the 30-case bump is below MIN_PEAK_SHARE
+PEAKS = {
+    'Alpha': [(100, 1000.0), (250, 500.0), (400, 2000.0), (550, 30.0)],
+    'Beta': [(300, 800.0), (650, 400.0)]
+}
+CONTINENTS = {'Alpha': 'Europe', 'Beta': 'Asia'}
+
+
+def wave_frame(freq='D'):
+    day = np.arange(len(DATES))
+    frames = []
+    for country, peaks in PEAKS.items():
+        new_cases = sum(height * np.exp(-((day - peak) / 20.0) ** 2) for peak, height in peaks) + 1
+        frames.append(pd.DataFrame({
+            'date': DATES,
+            'location': country,
+            'iso_code': country[:3].upper(),
+            'continent': CONTINENTS[country],
+            'new_cases': new_cases,
+            'population': 1e6
+        }))
+    df = pd.concat(frames, ignore_index=True)
+    if freq != 'D':
+        df = df.groupby(['location', 'iso_code', 'continent', pd.Grouper(key='date', freq=freq)]).agg(
+            new_cases=('new_cases', 'sum'), population=('population', 'last')
+        ).reset_index()
+    return df
+
+
+def find_waves(df):
+    return build_waves(df, build_hierarchy(df))
+
+
+# Peak dates within `tolerance` days of the expected peaks, allowing for the smoothing lag
+def assert_peaks(waves, expected, tolerance):
+    assert len(waves) == len(expected)
+    assert waves['wave'].tolist() == list(range(1, len(expected) + 1))
+    lags = (waves['peak_date'].to_numpy() - DATES[expected].to_numpy()) / np.timedelta64(1, 'D')
+    assert (np.abs(lags) <= tolerance).all(), lags
+
+
+@pytest.mark.parametrize('freq, tolerance', [('D', 10), ('W-SUN', 14)])
+def test_waves_of_every_country(freq, tolerance):
+    waves = find_waves(wave_frame(freq))
+
+    for country, peaks in PEAKS.items():
+        expected = [day for day, height in peaks if height >= 0.1 * max(height for _, height in peaks)]
+        assert_peaks(waves['waves'][waves['waves']['location'] == country], expected, tolerance)
+    assert waves['countries'].loc['Alpha', 'waves'] == 3
+    assert waves['countries'].loc['Beta', 'waves'] == 2
+
+
+def test_largest_and_latest_peaks():
+    waves = find_waves(wave_frame())
+    alpha = waves['countries'].loc['Alpha']
+
+    assert alpha['continent'] == 'Europe'
+    assert abs((alpha['largest_peak_date'] - DATES[400]).days) <= 10
+    assert alpha['largest_peak_per_million'] == pytest.approx(alpha['largest_peak_new_cases'], rel=1e-9)
+    assert abs((alpha['latest_peak_date'] - DATES[400]).days) <= 10
+    assert recent_waves(waves).index.tolist() == ['Beta']
+
+
+def test_level_waves_sum_their_countries():
+    waves = find_waves(wave_frame())
+
+    assert_peaks(level_waves(waves, 'Asia'), [300, 650], 10)
+    # Alpha's day-250 peak is within WAVE_SEPARATION_DAYS of Beta's larger one, so the world has one wave there
+    assert_peaks(level_waves(waves, WORLD), [100, 300, 400, 650], 10)